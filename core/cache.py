@@ -0,0 +1,132 @@
+"""
+Versioned response caching and conditional GET support for anonymous
+read-only endpoints.
+
+Every cache namespace has a version counter that is part of the cache keys.
+Bumping the counter invalidates all the responses of the namespace in O(1),
+without scanning keys, so it works with any Django cache backend.
+"""
+
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def _version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def get_cache_version(namespace):
+    """Return the current version of the namespace"""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp so an evicted counter never reuses old versions
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(*namespaces):
+    """Invalidate every cached response of the given namespaces"""
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+class CachedResponseMixin:
+    """
+    Cache the data of successful ``cached_actions`` responses, keyed on the
+    namespace version, the action, the host and the normalized query string.
+    """
+    cache_namespace = None
+    cached_actions = ('list', 'retrieve')
+
+    def get_response_cache_key(self, request):
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists() for value in values
+        )
+        raw_key = f'{self.action}:{request.get_host()}:{request.path}:{params}'
+        digest = hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+        return f'response:{self.cache_namespace}:{get_cache_version(self.cache_namespace)}:{digest}'
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.cached_actions:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Answer ``If-None-Match``/``If-Modified-Since`` for ``conditional_actions``
+    with a 304 before any serialization, using one aggregate query over the
+    filtered queryset to derive the ETag and Last-Modified headers.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_conditional_state(self, request):
+        """Return ``(etag, last_modified)`` for the request, or None to skip"""
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        if not state['count']:
+            return None
+
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists() for value in values
+        )
+        version = get_cache_version(self.cache_namespace) if getattr(self, 'cache_namespace', None) else None
+        raw_etag = f"{version}:{state['count']}:{state['last_modified'].isoformat()}:{request.get_host()}:{params}"
+        etag = quote_etag(hashlib.md5(raw_etag.encode('utf-8')).hexdigest())
+        return etag, int(state['last_modified'].timestamp())
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+
+        state = self.get_conditional_state(request)
+        if state is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = state
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,26 @@
+"""
+Database helpers shared by the apps.
+"""
+
+from django.db import connections, router
+
+
+def supports_conflict_target(model):
+    """Whether the database of ``model`` can name the unique fields of an upsert"""
+    return connections[router.db_for_write(model)].features.supports_update_conflicts_with_target
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=None):
+    """
+    Insert ``objs``, updating ``update_fields`` of the rows that conflict on
+    ``unique_fields``.
+
+    MySQL can not name the conflicting fields: its ON DUPLICATE KEY UPDATE
+    applies to any unique key, so ``unique_fields`` is only given to the
+    databases that support it. The model must not have another unique key
+    the new rows could conflict on.
+    """
+    options = {'unique_fields': unique_fields} if supports_conflict_target(model) else {}
+    return model.objects.bulk_create(
+        objs, batch_size=batch_size, update_conflicts=True, update_fields=update_fields, **options
+    )
@@ -0,0 +1,167 @@
+import logging
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import force_authenticate
+from products.models import Category, Product
+from products.views import ProductViewSet
+from orders.models import Order, Payment
+from orders.views import OrderViewSet, PaymentViewSet
+
+logger = logging.getLogger(__name__)
+
+# Tables whose listing queries must always be served by an index
+CHECKED_TABLES = ('products_product', 'orders_order', 'orders_payment')
+
+PRODUCT_LISTINGS = [
+    '',
+    '?category={category}',
+    '?available=true&featured=true',
+    '?min_price=100&max_price=500&ordering=price',
+    '?ordering=-sales_count',
+    '?ordering=-view_count',
+]
+
+ORDER_LISTINGS = [
+    '',
+    '?status=pending&payment_status=paid',
+    '?ordering=total_price',
+]
+
+
+class Command(BaseCommand):
+    help = 'Seed a test database and fail if a listing query falls back to a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'Query plan checks are not supported on {connection.vendor}.')
+
+        # Run against a throwaway test database, never the configured one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                failures = self._check(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError(f'{failures} listing queries fall back to a full table scan.')
+        self.stdout.write('All listing queries use an index.')
+
+    def _check(self, options):
+        random.seed(0)
+        category, staff, customer = self._seed(options['products'], options['orders'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE' if connection.vendor == 'sqlite' else f'ANALYZE TABLE {", ".join(CHECKED_TABLES)}')
+
+        failures = 0
+        for query in PRODUCT_LISTINGS:
+            failures += self._check_listing(ProductViewSet, '/api/v1/products/products/', query.format(category=category.pk))
+        for user in (staff, customer):
+            for query in ORDER_LISTINGS:
+                failures += self._check_listing(OrderViewSet, '/api/v1/orders/orders/', query, user)
+            failures += self._check_listing(PaymentViewSet, '/api/v1/orders/payments/', '', user)
+        return failures
+
+    def _seed(self, product_count, order_count):
+        categories = Category.objects.bulk_create([
+            Category(name=f'Category {i}', slug=f'category-{i}') for i in range(20)
+        ])
+        now = timezone.now()
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                description=f'Sample product {i}',
+                price=Decimal(random.randint(10, 10000)),
+                stock=random.randint(0, 100),
+                available=random.random() < 0.9,
+                featured=random.random() < 0.05,
+                category=random.choice(categories),
+                sales_count=random.randint(0, 1000),
+                view_count=random.randint(0, 10000),
+            )
+            for i in range(product_count)
+        ], batch_size=1000)
+
+        staff = User.objects.create_user('plan_staff', 'plan_staff@example.com', is_staff=True)
+        customers = User.objects.bulk_create([
+            User(username=f'plan_customer_{i}', email=f'plan_customer_{i}@example.com') for i in range(50)
+        ])
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        payment_statuses = [choice for choice, _ in Order.PAYMENT_STATUS_CHOICES]
+        orders = Order.objects.bulk_create([
+            Order(
+                user=random.choice(customers),
+                status=random.choice(statuses),
+                payment_status=random.choice(payment_statuses),
+                shipping_address='Sample address',
+                shipping_city='City',
+                shipping_state='State',
+                shipping_country='Country',
+                shipping_postal_code='00000',
+                shipping_phone='000',
+                payment_method='card',
+                total_price=Decimal(random.randint(10, 10000)),
+            )
+            for _ in range(order_count)
+        ], batch_size=1000)
+        Order.objects.update(created_at=now - timedelta(days=1))
+        Payment.objects.bulk_create([
+            Payment(order=order, payment_id=f'pay-{order.pk}', amount=order.total_price, status='paid',
+                    payment_method='card')
+            for order in orders
+        ], batch_size=1000)
+
+        return categories[0], staff, customers[0]
+
+    def _check_listing(self, viewset, path, query, user=None):
+        request = RequestFactory().get(path + query)
+        if user is not None:
+            force_authenticate(request, user=user)
+        view = viewset.as_view({'get': 'list'})
+
+        with CaptureQueriesContext(connection) as context:
+            response = view(request)
+        if response.status_code != 200:
+            raise CommandError(f'{path}{query} returned {response.status_code}.')
+
+        failures = 0
+        for captured in context.captured_queries:
+            sql = captured['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            full_scans = [table for table in self._full_scans(sql) if table in CHECKED_TABLES]
+            status = f'FULL SCAN of {", ".join(full_scans)}' if full_scans else 'ok'
+            self.stdout.write(f'{path}{query} [{user or "anonymous"}]: {status}')
+            if full_scans:
+                self.stdout.write(f'    {sql}')
+                failures += 1
+        return failures
+
+    def _full_scans(self, sql):
+        """Return the tables the query plan reads without an index"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                return [
+                    detail.split()[1] for detail in details
+                    if detail.startswith('SCAN ') and 'USING' not in detail
+                ]
+
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [row['table'] for row in rows if row['type'] == 'ALL']
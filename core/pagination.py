@@ -0,0 +1,226 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Mapping
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination keyed on the ordering fields plus ``(created_at, id)``.
+
+    Pages are fetched with ``WHERE (ordering keys) > (last row)`` and ``LIMIT``,
+    so no OFFSET or COUNT(*) is ever issued. Cursors are opaque base64 tokens
+    holding the key values of the row at the edge of the page.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+        max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+        value = request.query_params.get(self.page_size_query_param)
+        if value:
+            try:
+                page_size = int(value)
+            except ValueError:
+                pass
+        return max(1, min(page_size, max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the ordering fields, always ending with the ``(created_at, id)``
+        tie-breakers so that every row has a unique position.
+        """
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        # Fall back to an ordering set by a filter backend (e.g. search relevance)
+        if not ordering and queryset.query.order_by:
+            ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+
+        ordering = list(ordering or [])
+        for field in self.default_ordering:
+            if field.lstrip('-') not in [f.lstrip('-') for f in ordering]:
+                ordering.append(field)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        ordering = self._invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, position))
+
+        # Fetch one extra row to know whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._build_link(self.get_position(self.page[-1], self.ordering), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._build_link(self.get_position(self.page[0], self.ordering), reverse=True)
+
+    def get_position(self, obj, ordering):
+        """Return the key values of ``obj`` for the given ordering"""
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = obj[name] if isinstance(obj, Mapping) else getattr(obj, name)
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position, reverse=False):
+        payload = {'p': [self._encode_value(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request, queryset=None):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(encoded + padding))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if queryset is not None:
+            position = self._coerce_position(queryset, position)
+        return position, reverse
+
+    def _coerce_position(self, queryset, position):
+        """
+        Convert the cursor values with the ordering fields, so a tampered
+        cursor is rejected here instead of failing in the query
+        """
+        coerced = []
+        for field_name, value in zip(self.ordering, position):
+            name = field_name.lstrip('-')
+            # The keyset comparison can not match NULL keys
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                if name in queryset.query.annotations:
+                    field = queryset.query.annotations[name].output_field
+                else:
+                    field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                coerced.append(value)
+                continue
+            try:
+                coerced.append(field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return coerced
+
+    def _build_link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    @staticmethod
+    def _invert(ordering):
+        return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+    @staticmethod
+    def _keyset_filter(ordering, position):
+        """
+        Build the row-value comparison ``(a, b, c) > (x, y, z)`` as
+        ``a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)``,
+        honouring the direction of each field.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
@@ -0,0 +1,95 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+def parse_fieldset(value):
+    """
+    Parse ``id,name,items.product_details.price`` into the tree
+    ``{'id': {}, 'name': {}, 'items': {'product_details': {'price': {}}}}``
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in filter(None, path.strip().split('.')):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def get_sparse_fieldset(request):
+    """
+    Return the ``(fields, omit)`` trees requested by the client. Writes
+    ignore them, every writable field is validated and rendered.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return {}, {}
+    params = request.query_params
+    return parse_fieldset(params.get(FIELDS_QUERY_PARAM)), parse_fieldset(params.get(OMIT_QUERY_PARAM))
+
+
+def is_field_requested(request, path):
+    """
+    Tell whether the dotted ``path`` will be rendered, so views can skip the
+    joins and prefetches of omitted fields
+    """
+    include, omit = get_sparse_fieldset(request)
+    for part in path.split('.'):
+        if include:
+            if part not in include:
+                return False
+            include = include[part]
+        if part in omit:
+            if not omit[part]:
+                return False
+            omit = omit[part]
+        else:
+            omit = {}
+    return True
+
+
+class SparseFieldsetMixin:
+    """
+    Render only the fields selected with ``?fields=`` and drop those listed in
+    ``?omit=``. Nested serializers are addressed with dotted paths, e.g.
+    ``?fields=id,items.product_details.name``. Only applies to reads.
+    """
+
+    def __init__(self, *args, sparse_fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if sparse_fieldset is not None:
+            self._sparse_fieldset = sparse_fieldset
+
+    def get_sparse_fieldset(self):
+        if not hasattr(self, '_sparse_fieldset'):
+            # Only the outermost serializer reads the query string, nested ones
+            # receive their part of it from the parent
+            parent = self.parent
+            if isinstance(parent, serializers.ListSerializer):
+                parent = parent.parent
+            request = self.context.get('request') if parent is None else None
+            self._sparse_fieldset = get_sparse_fieldset(request)
+        return self._sparse_fieldset
+
+    def get_nested_fieldset(self, name):
+        """Return the ``(fields, omit)`` trees that apply to the nested field ``name``"""
+        include, omit = self.get_sparse_fieldset()
+        return include.get(name, {}), omit.get(name, {})
+
+    def get_fields(self):
+        fields = super().get_fields()
+        include, omit = self.get_sparse_fieldset()
+
+        for name in list(fields):
+            if (include and name not in include) or (name in omit and not omit[name]):
+                del fields[name]
+                continue
+
+            field = fields[name]
+            if isinstance(field, serializers.ListSerializer):
+                field = field.child
+            if isinstance(field, SparseFieldsetMixin):
+                field._sparse_fieldset = self.get_nested_fieldset(name)
+
+        return fields
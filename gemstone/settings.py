@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'accounts',
     'products',
     'orders',
+    'recommendations',
     'core',
 ]
 
@@ -84,6 +85,19 @@ WSGI_APPLICATION = 'gemstone.wsgi.application'
 
 DATABASES = {'default': dj_database_url.parse(config('DATABASE_URL'))}
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='gemstone'),
+    }
+}
+
+# Seconds a cached catalog response is kept (entries are also invalidated on change)
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -142,6 +156,59 @@ REST_FRAMEWORK = {
     'VERSION_PARAM': 'version',
 }
 
+# Cursor pagination settings (?page_size= is capped at API_MAX_PAGE_SIZE)
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=20, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=100, cast=int)
+
+# Number of products embedded in the category detail
+CATEGORY_PRODUCTS_PREVIEW_SIZE = config('CATEGORY_PRODUCTS_PREVIEW_SIZE', default=12, cast=int)
+
+# Dotted path to a products.search backend, empty to use the database's full-text index
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='')
+
+# Maximum number of products returned by /products/bulk/?ids=
+PRODUCT_BULK_MAX_IDS = config('PRODUCT_BULK_MAX_IDS', default=100, cast=int)
+
+# Invalid rows listed in a product import report, the rest are only counted
+PRODUCT_IMPORT_MAX_ERRORS = config('PRODUCT_IMPORT_MAX_ERRORS', default=1000, cast=int)
+
+# Maximum number of products changed by one /products/bulk-update/ request
+PRODUCT_BULK_UPDATE_MAX_ITEMS = config('PRODUCT_BULK_UPDATE_MAX_ITEMS', default=5000, cast=int)
+
+# Product image variants are built by this many background threads per
+# process (0 to build them right after the upload commits), at this quality
+PRODUCT_IMAGE_WORKERS = config('PRODUCT_IMAGE_WORKERS', default=2, cast=int)
+PRODUCT_IMAGE_QUALITY = config('PRODUCT_IMAGE_QUALITY', default=80, cast=int)
+
+# Upper limits of the price buckets returned by the product facets
+PRODUCT_PRICE_FACET_BUCKETS = config('PRODUCT_PRICE_FACET_BUCKETS', default='100,500,1000,5000', cast=Csv(int))
+
+# Metal spot prices used by reprice_products: a products.pricing feed class and
+# the file path or URL it reads
+SPOT_PRICE_FEED = config('SPOT_PRICE_FEED', default='products.pricing.FileSpotPriceFeed')
+SPOT_PRICE_FEED_LOCATION = config('SPOT_PRICE_FEED_LOCATION', default=os.path.join(BASE_DIR, 'var', 'spot_prices.json'))
+
+# Product view counts are buffered in the cache and written in batches
+VIEW_COUNT_FLUSH_INTERVAL = config('VIEW_COUNT_FLUSH_INTERVAL', default=60, cast=int)  # seconds
+VIEW_COUNT_FLUSH_BATCH_SIZE = config('VIEW_COUNT_FLUSH_BATCH_SIZE', default=500, cast=int)
+
+# Trending products: events lose half their weight every TRENDING_HALF_LIFE hours
+TRENDING_HALF_LIFE = config('TRENDING_HALF_LIFE', default=24, cast=float)
+TRENDING_VIEW_WEIGHT = config('TRENDING_VIEW_WEIGHT', default=1, cast=float)
+TRENDING_SALE_WEIGHT = config('TRENDING_SALE_WEIGHT', default=10, cast=float)  # per unit sold
+TRENDING_SIZE = config('TRENDING_SIZE', default=20, cast=int)
+
+# Number of "frequently bought together" products kept per product
+RECOMMENDATIONS_TOP_K = config('RECOMMENDATIONS_TOP_K', default=10, cast=int)
+
+# Content-based similar products index, memory-mapped by the web workers
+SIMILAR_PRODUCTS_INDEX_DIR = config('SIMILAR_PRODUCTS_INDEX_DIR', default=os.path.join(BASE_DIR, 'var', 'similar_products'))
+SIMILAR_PRODUCTS_DIMENSIONS = config('SIMILAR_PRODUCTS_DIMENSIONS', default=2048, cast=int)
+SIMILAR_PRODUCTS_TOP_K = config('SIMILAR_PRODUCTS_TOP_K', default=10, cast=int)
+
+# Stock held by a cart is released after this many minutes
+STOCK_RESERVATION_TTL = config('STOCK_RESERVATION_TTL', default=15, cast=int)
+
 # SimpleJWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=config('ACCESS_TOKEN_LIFETIME_MINUTES', default=60, cast=int)),
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem, Payment
+from .models import Cart, CartItem, StockReservation, Order, OrderItem, Payment
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -7,16 +7,35 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'total_items', 'total_price', 'created_at', 'updated_at')
+    list_display = ('user', 'item_count', 'subtotal', 'created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
+    readonly_fields = ('subtotal', 'item_count')
     inlines = [CartItemInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals()
+
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'product', 'quantity', 'total_price', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('cart__user__username', 'product__name')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.cart.update_totals()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.cart.update_totals()
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('cart', 'product', 'quantity', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    search_fields = ('cart__user__username', 'product__name')
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
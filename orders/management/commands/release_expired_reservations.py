@@ -0,0 +1,34 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stock reservations in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        released = 0
+
+        try:
+            # Expired holds are already ignored when computing available stock,
+            # so they can be deleted in small batches without blocking checkouts
+            while True:
+                batch = list(
+                    StockReservation.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+                )
+                if not batch:
+                    break
+                released += StockReservation.objects.filter(pk__in=batch).delete()[0]
+        except Exception as error:
+            logger.exception('Erro inesperado em release_expired_reservations: %s', error)
+            raise
+
+        self.stdout.write(f"Released {released} expired stock reservations.")
@@ -0,0 +1,126 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from products.models import Category, Product
+from orders.models import Cart, CartItem
+from orders.services import increment_cart_item
+from orders.views import CartViewSet
+
+# A call that hits a deadlock or SQLite's database lock is rolled back whole
+# and retried, as a client would
+MAX_ATTEMPTS = 100
+
+
+class Command(BaseCommand):
+    help = 'Add one product to one cart from many threads at once and fail if an increment is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--calls', type=int, default=15, help='Calls per thread')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'Cart stress tests are not supported on {connection.vendor}.')
+
+        test_settings = settings.DATABASES[connection.alias]
+        if connection.vendor == 'sqlite':
+            # The threads need a file database, and to wait for the write lock
+            test_settings.setdefault('TEST', {})['NAME'] = os.path.join(tempfile.gettempdir(), 'stress_cart_items.sqlite3')
+            test_settings.setdefault('OPTIONS', {})['timeout'] = 60
+
+        # Run against a throwaway test database, never the configured one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                failures = self._stress(options['threads'], options['calls'])
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(f"{options['threads']} threads x {options['calls']} calls, no increment lost.")
+
+    def _stress(self, threads, calls):
+        user = User.objects.create_user('stress_customer', 'stress_customer@example.com')
+        cart, _ = Cart.objects.get_or_create(user=user)
+        category = Category.objects.create(name='Stress', slug='stress')
+        through_view, direct = (
+            Product.objects.create(name=f'Stress {name}', slug=f'stress-{name}', description='Stress test product',
+                                   price=Decimal('10.00'), stock=threads * calls, category=category)
+            for name in ('view', 'direct')
+        )
+
+        add_item = CartViewSet.as_view({'post': 'add_item'})
+        factory = APIRequestFactory()
+
+        def call_view():
+            request = factory.post(
+                f'/api/v1/orders/carts/{cart.pk}/add_item/', {'product': through_view.pk, 'quantity': 1}, format='json'
+            )
+            force_authenticate(request, user=user)
+            response = add_item(request, pk=cart.pk)
+            return response.status_code == 201
+
+        def call_direct():
+            # Without the cart lock of add_item, so the insert race is exercised
+            with transaction.atomic():
+                increment_cart_item(cart, direct, 1)
+            return True
+
+        failures = []
+        for name, product, call in (('add_item', through_view, call_view), ('increment_cart_item', direct, call_direct)):
+            errors, retries = self._run(call, threads, calls)
+            self.stdout.write(f'{name}: {retries} calls retried after a deadlock or lock timeout.')
+            lines = list(CartItem.objects.filter(cart=cart, product=product).values_list('quantity', flat=True))
+            if errors or lines != [threads * calls]:
+                failures.append(
+                    f'{name}: expected one line of {threads * calls}, got {lines} and {len(errors)} failed calls '
+                    f'{errors[:5]}'
+                )
+        return failures
+
+    def _run(self, call, threads, calls):
+        """
+        Run ``call`` ``calls`` times in each of ``threads`` threads started
+        together. Returns ``(errors, retries)``.
+        """
+        barrier = threading.Barrier(threads)
+        errors, retries = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(calls):
+                    for attempt in range(MAX_ATTEMPTS):
+                        try:
+                            if not call():
+                                errors.append('rejected')
+                            break
+                        except OperationalError:
+                            retries.append(attempt)
+                            # Jittered backoff, so the threads stop colliding
+                            time.sleep(random.uniform(0, 0.005 * 2 ** min(attempt, 6)))
+                        except Exception as error:
+                            errors.append(repr(error))
+                            break
+                    else:
+                        errors.append(f'gave up after {MAX_ATTEMPTS} attempts')
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return errors, len(retries)
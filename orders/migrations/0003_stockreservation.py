@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_sales_count_product_view_count'),
+        ('orders', '0002_wishlist_wishlistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='orders.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at', 'quantity'], name='orders_reservation_active_idx'), models.Index(fields=['expires_at'], name='orders_reservation_expiry_idx')],
+                'unique_together': {('cart', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:42
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def populate_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('orders', 'Cart')
+    CartItem = apps.get_model('orders', 'CartItem')
+
+    totals = CartItem.objects.values('cart_id').annotate(
+        subtotal=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        item_count=Sum('quantity')
+    )
+    for row in totals.iterator():
+        Cart.objects.filter(pk=row['cart_id']).update(subtotal=row['subtotal'], item_count=row['item_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(populate_cart_totals, migrations.RunPython.noop),
+    ]
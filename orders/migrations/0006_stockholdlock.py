@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_image_variants'),
+        ('orders', '0005_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHoldLock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='products.product')),
+            ],
+        ),
+    ]
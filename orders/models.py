@@ -1,25 +1,66 @@
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from core.models import TimeStampedModel
 from products.models import Product
 
 
+CART_TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def cart_totals(prefix=''):
+    """Aggregates computing the cart totals from the current product prices"""
+    return {
+        'live_total_price': Coalesce(
+            Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'), output_field=CART_TOTAL_FIELD),
+            Value(0), output_field=CART_TOTAL_FIELD
+        ),
+        'live_total_items': Coalesce(Sum(f'{prefix}quantity'), 0),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each cart with totals computed by the database"""
+        return self.annotate(**cart_totals('items__'))
+
+
 class Cart(TimeStampedModel):
     """
     Shopping cart model
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    objects = CartQuerySet.as_manager()
 
     def __str__(self):
         return f"Cart for {self.user.username}"
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return getattr(self, 'live_total_price', self.subtotal)
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return getattr(self, 'live_total_items', self.item_count)
+
+    def update_totals(self):
+        """
+        Recompute the persisted subtotal and item count. Call it in the same
+        transaction as the change to the cart items.
+        """
+        totals = self.items.aggregate(**cart_totals())
+        self.subtotal = totals['live_total_price']
+        self.item_count = totals['live_total_items']
+        Cart.objects.filter(pk=self.pk).update(
+            subtotal=self.subtotal,
+            item_count=self.item_count,
+            updated_at=timezone.now()
+        )
 
 
 class CartItem(TimeStampedModel):
@@ -41,6 +82,37 @@ class CartItem(TimeStampedModel):
         return self.product.price * self.quantity
 
 
+class StockReservation(TimeStampedModel):
+    """
+    Time-limited hold on product stock, placed when a product is added to a cart
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('cart', 'product')
+        indexes = [
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='orders_reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='orders_reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} held for {self.cart.user.username}"
+
+
+class StockHoldLock(models.Model):
+    """
+    Row locked while holds on a product are placed, so concurrent holds are
+    serialized without locking the product row itself
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+
+    def __str__(self):
+        return f"Stock hold lock of {self.product_id}"
+
+
 class Order(TimeStampedModel):
     """
     Order model
@@ -73,6 +145,15 @@ class Order(TimeStampedModel):
     payment_details = models.JSONField(blank=True, null=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        # Listings are keyset paginated on (ordering field, created_at, id)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='orders_newest_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='orders_user_newest_idx'),
+            models.Index(fields=['status', 'payment_status', '-created_at', '-id'], name='orders_status_newest_idx'),
+            models.Index(fields=['total_price', '-created_at', '-id'], name='orders_total_price_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -107,6 +188,11 @@ class Payment(TimeStampedModel):
     payment_method = models.CharField(max_length=50)
     payment_details = models.JSONField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='payments_newest_idx'),
+        ]
+
     def __str__(self):
         return f"Payment {self.payment_id} for order {self.order.id}"
 
@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from .models import Cart, CartItem, Order, OrderItem, Payment, Wishlist, WishlistItem
+from core.serializers import SparseFieldsetMixin
 from products.serializers import ProductListSerializer
 from products.models import Product
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product_details = ProductListSerializer(source='product', read_only=True)
     total_price = serializers.ReadOnlyField()
 
@@ -14,7 +15,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['cart']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.ReadOnlyField()
     total_items = serializers.ReadOnlyField()
@@ -25,7 +26,28 @@ class CartSerializer(serializers.ModelSerializer):
         read_only_fields = ['user']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CartOperationSerializer(serializers.Serializer):
+    OPERATION_CHOICES = (
+        ('add', 'Add'),
+        ('set', 'Set'),
+        ('remove', 'Remove'),
+    )
+
+    op = serializers.ChoiceField(choices=OPERATION_CHOICES)
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product_details = ProductListSerializer(source='product', read_only=True)
     total_price = serializers.ReadOnlyField()
 
@@ -35,14 +57,14 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['order', 'price']
 
 
-class OrderListSerializer(serializers.ModelSerializer):
+class OrderListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'user', 'status', 'payment_status', 'total_price', 'created_at']
         read_only_fields = ['user']
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -72,7 +94,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['order']
 
 
-class WishlistItemSerializer(serializers.ModelSerializer):
+class WishlistItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(),
@@ -86,7 +108,7 @@ class WishlistItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = WishlistItemSerializer(many=True, read_only=True)
 
     class Meta:
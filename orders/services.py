@@ -0,0 +1,244 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+from core.db import bulk_upsert
+from products.models import Product
+from products.signals import invalidate_catalog_cache
+from products.trending import record_sales
+from .models import Cart, CartItem, OrderItem, StockHoldLock, StockReservation
+
+
+def _per_product(quantities):
+    """Return a CASE expression mapping each product id to its quantity"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0)
+    )
+
+
+def lock_cart(cart):
+    """
+    Lock the cart row for the current transaction, so changes to a cart and
+    its checkout never interleave
+    """
+    return Cart.objects.select_for_update().get(pk=cart.pk)
+
+
+def reserved_stock(exclude_cart=None):
+    """
+    Expression with the quantity of each product held by active reservations,
+    served by the (product, expires_at, quantity) index.
+    """
+    reservations = StockReservation.objects.filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    total = reservations.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), 0)
+
+
+def available_to_sell(product_ids, exclude_cart=None):
+    """Return {product_id: stock not held by other carts} with a single query"""
+    rows = Product.objects.filter(pk__in=product_ids).annotate(
+        reserved=reserved_stock(exclude_cart)
+    ).values_list('pk', 'stock', 'reserved')
+    return {pk: max(stock - reserved, 0) for pk, stock, reserved in rows}
+
+
+def lock_holds(product_ids):
+    """
+    Lock the StockHoldLock rows of the products, created on first use, so
+    holds on the same product are placed one at a time while the product row
+    stays free for readers, checkouts and stock updates
+    """
+    # Lock rows in primary key order so concurrent holds cannot deadlock
+    locks = StockHoldLock.objects.select_for_update().order_by('pk')
+    missing = set(product_ids) - set(locks.filter(pk__in=product_ids).values_list('pk', flat=True))
+    if missing:
+        # Existing rows are locked first, an insert that hits one only takes
+        # a shared lock on MySQL
+        StockHoldLock.objects.bulk_create(
+            [StockHoldLock(product_id=product_id) for product_id in missing], ignore_conflicts=True
+        )
+        list(locks.filter(pk__in=missing).values_list('pk', flat=True))
+
+
+def hold_stock(cart, product, quantity):
+    """
+    Place or refresh a STOCK_RESERVATION_TTL hold of ``quantity`` units for the cart.
+
+    Holds on a product are serialized by its StockHoldLock row, so two carts
+    can not both hold the last units; checkout, which locks the product,
+    remains the authoritative stock check.
+    """
+    hold_stocks(cart, {product.pk: quantity}, {product.pk: product})
+
+
+def hold_stocks(cart, quantities, products):
+    """Hold ``{product_id: quantity}`` for the cart with one read and one upsert"""
+    lock_holds(quantities)
+    # Read once the lock is held: under READ COMMITTED, Django's default on
+    # MySQL, it sees the holds committed while this one waited
+    available = available_to_sell(quantities, exclude_cart=cart)
+
+    errors = {}
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        if not product.available or available.get(product_id, 0) < quantity:
+            errors[str(product_id)] = f"Only {available.get(product_id, 0)} units of {product.name} are available"
+    if errors:
+        if len(errors) == 1:
+            raise serializers.ValidationError({"detail": next(iter(errors.values()))})
+        raise serializers.ValidationError({"detail": "Insufficient stock", "items": errors})
+
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_TTL)
+    bulk_upsert(
+        StockReservation,
+        [
+            StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ],
+        unique_fields=['cart', 'product'],
+        update_fields=['quantity', 'expires_at', 'updated_at']
+    )
+
+
+def increment_cart_item(cart, product, quantity):
+    """
+    Insert the cart line or atomically add ``quantity`` to it.
+
+    The increment is a single UPDATE with an F() expression; when the line does
+    not exist yet it is inserted, and if a concurrent request wins the insert
+    the unique (cart, product) constraint makes us fall back to the increment.
+    """
+    lines = CartItem.objects.filter(cart=cart, product=product)
+    increment = {'quantity': F('quantity') + quantity, 'updated_at': timezone.now()}
+
+    if not lines.update(**increment):
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        except IntegrityError:
+            lines.update(**increment)
+
+    return lines.get()
+
+
+def release_stock(cart, product_ids=None):
+    """Drop the holds of the cart, optionally only for some products"""
+    reservations = StockReservation.objects.filter(cart=cart)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    reservations.delete()
+
+
+@transaction.atomic
+def apply_cart_operations(cart, operations):
+    """
+    Apply a list of add/set/remove operations to the cart.
+
+    Products are validated with one query, the resulting quantities are
+    written with one bulk upsert and one delete, and stock holds follow.
+    """
+    lock_cart(cart)
+    product_ids = {operation['product'] for operation in operations}
+    products = Product.objects.only('id', 'name', 'available').in_bulk(product_ids)
+
+    missing = sorted(product_ids - set(products))
+    if missing:
+        raise serializers.ValidationError({"detail": "Products not found", "products": missing})
+
+    current = dict(cart.items.filter(product_id__in=product_ids).values_list('product_id', 'quantity'))
+    quantities = dict(current)
+    for operation in operations:
+        product_id = operation['product']
+        if operation['op'] == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif operation['op'] == 'set':
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+
+    changed = {
+        product_id: quantity for product_id, quantity in quantities.items()
+        if quantity > 0 and current.get(product_id) != quantity
+    }
+    removed = [product_id for product_id, quantity in quantities.items() if quantity == 0 and product_id in current]
+
+    if changed:
+        bulk_upsert(
+            CartItem,
+            [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in changed.items()],
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'updated_at']
+        )
+        hold_stocks(cart, changed, products)
+    if removed:
+        cart.items.filter(product_id__in=removed).delete()
+        release_stock(cart, removed)
+
+    cart.update_totals()
+
+
+@transaction.atomic
+def checkout_cart(cart, order_serializer):
+    """
+    Turn the cart into an order.
+
+    The involved products are locked with a single SELECT ... FOR UPDATE, stock
+    is validated and decremented, the order items are bulk created and the
+    sales counters are updated with F() expressions, so the number of queries
+    does not depend on the size of the cart. Stock held by other carts is not
+    sold, and the holds of this cart are released.
+    """
+    # A concurrent change or second checkout of the cart waits for this one
+    cart = lock_cart(cart)
+    quantities = dict(cart.items.values_list('product_id', 'quantity'))
+    if not quantities:
+        raise serializers.ValidationError({"detail": "Cart is empty"})
+
+    # Lock rows in primary key order so concurrent checkouts cannot deadlock
+    products = {
+        product.pk: product
+        for product in Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk').only(
+            'id', 'name', 'price', 'stock', 'available'
+        ).annotate(reserved=reserved_stock(exclude_cart=cart))
+    }
+
+    errors = {}
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or not product.available:
+            errors[str(product_id)] = "Product is not available"
+        elif product.stock - product.reserved < quantity:
+            available = max(product.stock - product.reserved, 0)
+            errors[str(product_id)] = f"Only {available} units of {product.name} are in stock"
+    if errors:
+        raise serializers.ValidationError({"detail": "Insufficient stock", "items": errors})
+
+    total_price = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
+    order = order_serializer.save(user=cart.user, total_price=total_price)
+
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=product_id, quantity=quantity, price=products[product_id].price)
+        for product_id, quantity in quantities.items()
+    ])
+
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') - _per_product(quantities),
+        sales_count=F('sales_count') + _per_product(quantities),
+        updated_at=timezone.now()
+    )
+
+    cart.items.all().delete()
+    release_stock(cart)
+    cart.update_totals()
+
+    # Stock and sales counts changed without firing the product signals
+    invalidate_catalog_cache()
+    record_sales(quantities)
+
+    return order
@@ -1,17 +1,44 @@
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, extend_schema_view
+from core.pagination import KeysetCursorPagination
+from core.serializers import is_field_requested
+from products.models import main_image_prefetch
 from .models import Cart, CartItem, Order, OrderItem, Payment, Wishlist, WishlistItem
+from .services import (
+    apply_cart_operations, checkout_cart, hold_stock, increment_cart_item, lock_cart, release_stock
+)
 from .serializers import (
-    CartSerializer, CartItemSerializer,
+    CartSerializer, CartItemSerializer, CartBatchSerializer,
     OrderListSerializer, OrderDetailSerializer, OrderCreateSerializer,
     OrderItemSerializer, PaymentSerializer,
     WishlistSerializer, WishlistItemSerializer
 )
 
 
+def items_with_products(model, request=None, product_field='product_details'):
+    """
+    Prefetch the items of a cart, order or wishlist with the product data they
+    render, skipping what the client left out with ?fields=/?omit=
+    """
+    queryset = model.objects.all()
+    product_path = f'items.{product_field}'
+
+    if is_field_requested(request, f'{product_path}.category_name'):
+        queryset = queryset.select_related('product__category')
+    elif is_field_requested(request, product_path) or is_field_requested(request, 'items.total_price'):
+        queryset = queryset.select_related('product')
+    if is_field_requested(request, f'{product_path}.main_image'):
+        queryset = queryset.prefetch_related(main_image_prefetch('product__images'))
+
+    return Prefetch('items', queryset=queryset)
+
+
 @extend_schema_view(
     list=extend_schema(description="List all carts"),
     retrieve=extend_schema(description="Retrieve a cart by ID"),
@@ -21,7 +48,13 @@ class CartViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        queryset = Cart.objects.filter(user=self.request.user)
+        if self.action in ['list', 'retrieve']:
+            if is_field_requested(self.request, 'total_price') or is_field_requested(self.request, 'total_items'):
+                queryset = queryset.with_totals()
+            if is_field_requested(self.request, 'items'):
+                queryset = queryset.prefetch_related(items_with_products(CartItem, self.request))
+        return queryset
 
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
@@ -33,17 +66,14 @@ class CartViewSet(viewsets.ReadOnlyModelViewSet):
             product = serializer.validated_data['product']
             quantity = serializer.validated_data['quantity']
 
-            # Check if item already exists in cart
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
+            with transaction.atomic():
+                lock_cart(cart)
+                # Insert the line or increment its quantity without a read-modify-write
+                cart_item = increment_cart_item(cart, product, quantity)
 
-            # If item exists, update quantity
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+                # Hold the stock for the cart, rolling back if it is not available
+                hold_stock(cart, product, cart_item.quantity)
+                cart.update_totals()
 
             return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -55,7 +85,11 @@ class CartViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             item_id = request.data.get('item_id')
             item = CartItem.objects.get(id=item_id, cart=cart)
-            item.delete()
+            with transaction.atomic():
+                lock_cart(cart)
+                item.delete()
+                release_stock(cart, [item.product_id])
+                cart.update_totals()
             return Response(status=status.HTTP_204_NO_CONTENT)
         except CartItem.DoesNotExist:
             return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
@@ -66,21 +100,55 @@ class CartViewSet(viewsets.ReadOnlyModelViewSet):
         cart = self.get_object()
         try:
             item_id = request.data.get('item_id')
-            quantity = request.data.get('quantity')
-
-            item = CartItem.objects.get(id=item_id, cart=cart)
-            item.quantity = quantity
-            item.save()
+            quantity = int(request.data.get('quantity'))
+
+            if quantity < 0:
+                raise ValueError
+
+            item = CartItem.objects.select_related('product').get(id=item_id, cart=cart)
+            with transaction.atomic():
+                lock_cart(cart)
+                if quantity == 0:
+                    # Like the "set" operation of batch, zero removes the item
+                    item.delete()
+                    release_stock(cart, [item.product_id])
+                    cart.update_totals()
+                    return Response(status=status.HTTP_204_NO_CONTENT)
+
+                item.quantity = quantity
+                item.save()
+                hold_stock(cart, item.product, quantity)
+                cart.update_totals()
 
             return Response(CartItemSerializer(item).data)
+        except (TypeError, ValueError):
+            return Response({"detail": "Invalid quantity"}, status=status.HTTP_400_BAD_REQUEST)
         except CartItem.DoesNotExist:
             return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
 
+    @extend_schema(request=CartBatchSerializer, responses={200: CartSerializer})
+    @action(detail=True, methods=['post'])
+    def batch(self, request, pk=None):
+        """Apply several add/set/remove operations to the cart in one transaction"""
+        cart = self.get_object()
+        serializer = CartBatchSerializer(data=request.data)
+
+        if serializer.is_valid():
+            apply_cart_operations(cart, serializer.validated_data['operations'])
+
+            cart = Cart.objects.with_totals().prefetch_related(items_with_products(CartItem)).get(pk=cart.pk)
+            return Response(CartSerializer(cart, context=self.get_serializer_context()).data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['post'])
     def clear(self, request, pk=None):
         """Clear all items from the cart"""
         cart = self.get_object()
-        cart.items.all().delete()
+        with transaction.atomic():
+            lock_cart(cart)
+            cart.items.all().delete()
+            release_stock(cart)
+            cart.update_totals()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -94,12 +162,18 @@ class OrderViewSet(viewsets.ModelViewSet):
     filterset_fields = ['status', 'payment_status']
     ordering_fields = ['created_at', 'total_price']
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(user=user)
+            queryset = Order.objects.all()
+        else:
+            queryset = Order.objects.filter(user=user)
+
+        if self.action == 'retrieve' and is_field_requested(self.request, 'items'):
+            queryset = queryset.prefetch_related(items_with_products(OrderItem, self.request))
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -109,45 +183,13 @@ class OrderViewSet(viewsets.ModelViewSet):
         return OrderListSerializer
 
     def perform_create(self, serializer):
-        user = self.request.user
-
         # Get user's cart
         try:
-            cart = Cart.objects.get(user=user)
+            cart = Cart.objects.select_related('user').get(user=self.request.user)
         except Cart.DoesNotExist:
-            return Response({"detail": "Cart not found"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Check if cart has items
-        if cart.items.count() == 0:
-            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Calculate total price
-        total_price = cart.total_price
-
-        # Create order
-        order = serializer.save(
-            user=user,
-            total_price=total_price
-        )
-
-        # Create order items from cart items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-
-            # Increment sales_count for the product
-            product = cart_item.product
-            product.sales_count += cart_item.quantity
-            product.save()
-
-        # Clear cart
-        cart.items.all().delete()
+            raise ValidationError({"detail": "Cart not found"})
 
-        return order
+        return checkout_cart(cart, serializer)
 
 
 @extend_schema_view(
@@ -158,6 +200,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -194,6 +237,8 @@ class WishlistViewSet(viewsets.GenericViewSet):
     def list(self, request):
         """Get the current user's wishlist"""
         wishlist = self.get_object()
+        if is_field_requested(request, 'items'):
+            prefetch_related_objects([wishlist], items_with_products(WishlistItem, request, product_field='product'))
         serializer = self.get_serializer(wishlist)
         return Response(serializer.data)
 
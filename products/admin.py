@@ -14,8 +14,9 @@ class ProductImageInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'stock', 'available', 'featured', 'sales_count', 'view_count', 'created_at')
-    list_filter = ('available', 'featured', 'category', 'created_at')
+    list_display = ('name', 'category', 'price', 'metal_type', 'fine_weight', 'premium', 'stock', 'available',
+                    'featured', 'sales_count', 'view_count', 'created_at')
+    list_filter = ('available', 'featured', 'metal_type', 'category', 'created_at')
     list_editable = ('price', 'stock', 'available', 'featured')
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
@@ -7,3 +8,8 @@ class ProductsConfig(AppConfig):
 
     def ready(self):
         import products.admin  # noqa
+        import products.signals  # noqa
+        import products.images  # noqa
+        import products.view_counter  # noqa
+        from products.search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,105 @@
+"""
+Bulk price and stock updates, such as the batches sent by the warehouse system.
+
+The products are locked with a single SELECT ... FOR UPDATE and written with
+one bulk_update() per set of changed fields, so a batch of thousands of SKUs
+takes a handful of queries. Relative stock changes are applied with F()
+expressions. The catalog cache is invalidated once per batch.
+"""
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Product
+from .price_history import record_price_changes
+from .signals import invalidate_catalog_cache
+
+UPDATE_FIELDS = ('price', 'price_discount', 'stock', 'available')
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(key):
+    """Return the product id of a plain integer key, None for a slug"""
+    key = str(key)
+    # isdigit() alone accepts digits such as "²" that int() rejects
+    if key.isascii() and key.isdigit() and int(key) <= MAX_ID:
+        return int(key)
+    return None
+
+
+def bulk_update_products(updates, batch_size=500):
+    """
+    Apply ``{id or slug: validated changes}`` and return ``{id or slug: result}``,
+    see ProductBulkUpdateSerializer for the changes
+    """
+    ids = {key: product_id for key in updates if (product_id := parse_id(key)) is not None}
+    slugs = [key for key in updates if key not in ids]
+    results = {}
+
+    with transaction.atomic():
+        # Lock rows in primary key order so concurrent updates cannot deadlock
+        products = list(
+            Product.objects.select_for_update().filter(Q(pk__in=ids.values()) | Q(slug__in=slugs))
+            .order_by('pk').only('id', 'slug', *UPDATE_FIELDS)
+        )
+        by_id = {product.pk: product for product in products}
+        by_slug = {product.slug: product for product in products}
+
+        groups = {}
+        updated = {}
+        for key, changes in updates.items():
+            product = by_id.get(ids[key]) if key in ids else by_slug.get(key)
+            if product is None:
+                results[key] = {'status': 'not_found'}
+                continue
+            if product.pk in updated:
+                results[key] = {'status': 'invalid', 'errors': {'detail': [
+                    f'Product {product.pk} is already updated by "{updated[product.pk]}".'
+                ]}}
+                continue
+
+            changes = dict(changes)
+            delta = changes.pop('stock_delta', None)
+            if delta is not None and product.stock + delta < 0:
+                results[key] = {'status': 'invalid', 'errors': {'stock_delta': [
+                    f'Only {product.stock} units are in stock.'
+                ]}}
+                continue
+
+            for name, value in changes.items():
+                setattr(product, name, value)
+            stock = product.stock
+            if delta is not None:
+                stock += delta
+                product.stock = F('stock') + delta
+                changes['stock'] = stock
+
+            updated[product.pk] = key
+            groups.setdefault(frozenset(changes), []).append(product)
+            results[key] = {
+                'status': 'updated',
+                'id': product.pk,
+                'slug': product.slug,
+                'price': product.price,
+                'price_discount': product.price_discount,
+                'stock': stock,
+                'available': product.available
+            }
+
+        now = timezone.now()
+        for fields, group in groups.items():
+            for product in group:
+                product.updated_at = now
+            Product.objects.bulk_update(group, [*sorted(fields), 'updated_at'], batch_size=batch_size)
+
+        record_price_changes([
+            (product.pk, product.price, product.price_discount)
+            for group in groups.values() for product in group
+            if product.get_loaded_prices() != product._loaded_prices
+        ], now)
+
+        # bulk_update() does not fire the product signals
+        if groups:
+            invalidate_catalog_cache()
+
+    return results
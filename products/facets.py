@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+def price_bucket_bounds():
+    """Return the (min, max) price of every PRODUCT_PRICE_FACET_BUCKETS bucket"""
+    limits = settings.PRODUCT_PRICE_FACET_BUCKETS
+    return list(zip([0] + limits, limits + [None]))
+
+
+def product_facets(queryset):
+    """
+    Count the products of the queryset per category, availability, featured
+    flag and price bucket with a single grouped aggregate query
+    """
+    limits = settings.PRODUCT_PRICE_FACET_BUCKETS
+    price_bucket = Case(
+        *[When(price__lt=limit, then=Value(index)) for index, limit in enumerate(limits)],
+        default=Value(len(limits)),
+        output_field=IntegerField()
+    )
+    rows = queryset.order_by().annotate(price_bucket=price_bucket).values(
+        'category_id', 'category__name', 'available', 'featured', 'price_bucket'
+    ).annotate(count=Count('pk'))
+
+    total = 0
+    categories = {}
+    available = {'true': 0, 'false': 0}
+    featured = {'true': 0, 'false': 0}
+    prices = [0] * (len(limits) + 1)
+
+    for row in rows:
+        count = row['count']
+        total += count
+        category = categories.setdefault(
+            row['category_id'], {'id': row['category_id'], 'name': row['category__name'], 'count': 0}
+        )
+        category['count'] += count
+        available['true' if row['available'] else 'false'] += count
+        featured['true' if row['featured'] else 'false'] += count
+        prices[row['price_bucket']] += count
+
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=lambda category: (-category['count'], category['name'])),
+        'available': available,
+        'featured': featured,
+        'price': [
+            {'min': minimum, 'max': maximum, 'count': count}
+            for (minimum, maximum), count in zip(price_bucket_bounds(), prices)
+        ],
+    }
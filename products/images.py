@@ -0,0 +1,189 @@
+"""
+Resized derivatives of the product images.
+
+Uploads are stored as-is, then a thread pool resizes them after the request
+commits: every variant is saved as WebP and JPEG, EXIF orientation applied
+and metadata stripped, and the file names and dimensions are recorded in
+``ProductImage.variants``. The serializers build a WebP ``srcset`` and a JPEG
+``srcset_jpeg`` fallback from them, so listings load a few kilobyte
+thumbnail instead of the original photo. The variants of a deleted image
+are removed with it.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+from .models import ProductImage
+from .signals import invalidate_catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Name and longest side of each variant, smallest first
+VARIANTS = (
+    ('thumb', 160),
+    ('card', 480),
+    ('zoom', 1600),
+)
+FORMATS = (
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images'
+        )
+    return _executor
+
+
+def image_srcset(variants, url, image_format='webp'):
+    """
+    Return the ``srcset`` of the variants in ``image_format``, ``url`` turns a
+    storage name into the URL to render. None until the variants exist.
+    """
+    candidates = [
+        f"{url(variants[name][image_format])} {variants[name]['width']}w"
+        for name, _ in VARIANTS if name in variants
+    ]
+    return ', '.join(candidates) or None
+
+
+def _encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        if image.mode != 'RGB':
+            # Flatten transparency on white, JPEG has no alpha channel
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(buffer, 'JPEG', quality=settings.PRODUCT_IMAGE_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=settings.PRODUCT_IMAGE_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(image_name, storage, prefix):
+    """
+    Resize the image stored as ``image_name`` and save the variants under
+    ``prefix``. Returns ``(width, height, variants)`` of the original.
+    """
+    with storage.open(image_name, 'rb') as file:
+        original = Image.open(file)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    width, height = original.size
+    # Only the pixels are kept, which drops the EXIF, XMP and ICC metadata
+    original = original.convert('RGBA' if 'A' in original.getbands() or 'transparency' in original.info else 'RGB')
+
+    variants = {}
+    for name, size in VARIANTS:
+        resized = original.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variant = {'width': resized.width, 'height': resized.height}
+        for extension, image_format in FORMATS:
+            variant[extension] = storage.save(
+                f'{prefix}-{name}.{extension}', ContentFile(_encode(resized, image_format))
+            )
+        variants[name] = variant
+    return width, height, variants
+
+
+def delete_variants(variants, storage):
+    for variant in variants.values():
+        for extension, _ in FORMATS:
+            if variant.get(extension):
+                storage.delete(variant[extension])
+
+
+def process_image(image_id):
+    """
+    Build the variants of a ProductImage and record them, unless the image
+    was replaced or deleted in the meantime
+    """
+    image = ProductImage.objects.filter(pk=image_id).only('id', 'image', 'variants').first()
+    if image is None or not image.image:
+        return False
+
+    storage = image.image.storage
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    width, height, variants = generate_variants(
+        image.image.name, storage, f'products/variants/{image.pk}/{stem}'
+    )
+    updated = ProductImage.objects.filter(pk=image.pk, image=image.image.name).update(
+        width=width, height=height, variants=variants
+    )
+    if not updated:
+        delete_variants(variants, storage)
+        return False
+
+    if image.variants:
+        delete_variants(image.variants, storage)
+    # update() does not fire the image signals
+    invalidate_catalog_cache()
+    return True
+
+
+def _process(image_id):
+    try:
+        process_image(image_id)
+    except Exception:
+        logger.exception('Error generating the variants of product image %s', image_id)
+
+
+def _process_in_background(image_id):
+    try:
+        _process(image_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(image_id):
+    """
+    Build the variants of an image once the current transaction commits, in
+    the thread pool, or right away when PRODUCT_IMAGE_WORKERS is 0
+    """
+    if settings.PRODUCT_IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(_process_in_background, image_id))
+    else:
+        transaction.on_commit(lambda: _process(image_id))
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Signal to build the variants of new and replaced images, the variants of
+    the previous file are dropped right away
+    """
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if not created and instance.image.name == getattr(instance, '_loaded_image', None):
+        return
+    if not created and instance.variants:
+        variants, storage = instance.variants, instance.image.storage
+        ProductImage.objects.filter(pk=instance.pk).update(width=None, height=None, variants={})
+        transaction.on_commit(lambda: delete_variants(variants, storage))
+        instance.width = instance.height = None
+        instance.variants = {}
+    instance._loaded_image = instance.image.name
+    if instance.image:
+        schedule_variants(instance.pk)
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance, **kwargs):
+    """Signal to delete the variant files once the image deletion commits"""
+    if instance.variants:
+        variants, storage = instance.variants, instance.image.storage
+        transaction.on_commit(lambda: delete_variants(variants, storage))
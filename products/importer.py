@@ -0,0 +1,252 @@
+"""
+Bulk catalog import from CSV or JSON Lines.
+
+Rows are read one at a time from the file, validated with the model fields
+and upserted by slug in chunks: one ``INSERT ... ON CONFLICT (slug) DO
+UPDATE``, or ``ON DUPLICATE KEY UPDATE`` on MySQL, per chunk, each chunk in its own transaction, so memory stays flat
+however large the file is. Categories are referenced by slug and resolved
+from a single lookup. Invalid rows are skipped and reported with their line
+number, the rest of the file is still imported.
+
+Only the columns present in a row are written to an existing product, so a
+file with ``slug,name,price,category`` leaves the stock, discount and other
+fields of the products it updates untouched.
+"""
+
+import codecs
+import csv
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import BooleanField, CharField, TextField
+from django.utils import timezone
+from django.utils.text import slugify
+from core.db import bulk_upsert
+from .models import Category, Product
+from .price_history import record_price_changes
+from .signals import invalidate_catalog_cache
+
+FORMATS = ('csv', 'jsonl')
+
+IMPORT_FIELDS = (
+    'slug', 'name', 'description', 'price', 'price_discount', 'stock', 'available', 'category', 'featured',
+    'metal_type', 'fine_weight', 'premium'
+)
+# A product can not be created without these
+REQUIRED_FIELDS = ('name', 'price', 'category')
+
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+FALSE_VALUES = {'0', 'f', 'false', 'n', 'no'}
+
+
+def get_format(filename, default='csv'):
+    """Guess the format of a file from its extension"""
+    if filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(lines, file_format):
+    """
+    Yield ``(line number, row or None, error)`` from an iterable of text
+    lines, without reading the whole file
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Columns past the header are collected under the None key
+            row.pop(None, None)
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, None, f'Invalid JSON: {error}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def decode(file, encoding='utf-8-sig'):
+    """Iterate over the lines of a binary file, such as an uploaded file, as text"""
+    return codecs.iterdecode(file, encoding)
+
+
+class ProductImporter:
+    """
+    Upserts products by slug from rows of field values, see import_file().
+
+    ``errors`` keeps the first PRODUCT_IMPORT_MAX_ERRORS invalid rows as
+    ``{'line', 'slug', 'errors'}``, all of them are counted in ``failed``.
+    """
+
+    def __init__(self, batch_size=2000, max_errors=None):
+        self.batch_size = batch_size
+        self.max_errors = settings.PRODUCT_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS if name != 'category'}
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.created = self.updated = self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, slug, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'slug': slug, 'errors': errors})
+
+    def clean_value(self, field, value):
+        if isinstance(value, str):
+            value = value.strip()
+            if not value and not isinstance(field, (CharField, TextField)):
+                value = None
+        if isinstance(field, BooleanField) and isinstance(value, str):
+            if value.lower() in TRUE_VALUES:
+                value = True
+            elif value.lower() in FALSE_VALUES:
+                value = False
+        return field.clean(value, None)
+
+    def clean_row(self, row):
+        """
+        Return ``(values, errors)`` of a row, ``values`` maps the model
+        attributes to write to their cleaned value
+        """
+        values, errors = {}, {}
+        for name, value in row.items():
+            if name not in IMPORT_FIELDS:
+                continue
+            if name == 'category':
+                category = str(value or '').strip()
+                if category:
+                    if category in self.categories:
+                        values['category_id'] = self.categories[category]
+                    else:
+                        errors['category'] = [f'Unknown category "{category}".']
+                continue
+
+            field = self.fields[name]
+            # An empty value leaves a field that can not be null unchanged
+            if (value is None or value == '') and not field.null and name != 'metal_type':
+                continue
+            try:
+                values[name] = self.clean_value(field, value)
+            except ValidationError as error:
+                errors[name] = error.messages
+
+        if not values.get('slug') and 'slug' not in errors and values.get('name'):
+            values['slug'] = slugify(values['name'])[:self.fields['slug'].max_length]
+        if not values.get('slug') and 'slug' not in errors:
+            errors['slug'] = ['A slug or a name is required.']
+        return values, errors
+
+    def import_rows(self, rows):
+        """Import ``(line number, row or None, error)`` tuples, see read_rows()"""
+        chunk = {}
+        for line, row, error in rows:
+            if error:
+                self.add_error(line, None, {'row': [error]})
+                continue
+            values, errors = self.clean_row(row)
+            if errors:
+                self.add_error(line, values.get('slug') or row.get('slug'), errors)
+                continue
+            # The last row of a slug wins, ON CONFLICT can not update a row twice
+            chunk.pop(values['slug'], None)
+            chunk[values['slug']] = (line, values)
+            if len(chunk) >= self.batch_size:
+                self.write_chunk(chunk)
+                chunk = {}
+        if chunk:
+            self.write_chunk(chunk)
+
+        if self.created or self.updated:
+            invalidate_catalog_cache()
+        return self
+
+    def import_file(self, lines, file_format):
+        """Import an iterable of text lines in the ``csv`` or ``jsonl`` format"""
+        return self.import_rows(read_rows(lines, file_format))
+
+    def write_chunk(self, chunk):
+        rows = {}
+        try:
+            with transaction.atomic():
+                existing = {
+                    slug: (price, discount, category_id)
+                    for slug, price, discount, category_id in Product.objects.filter(
+                        slug__in=list(chunk)
+                    ).values_list('slug', 'price', 'price_discount', 'category_id')
+                }
+                for slug, (line, values) in chunk.items():
+                    missing = [name for name in REQUIRED_FIELDS if slug not in existing and
+                               (name + '_id' if name == 'category' else name) not in values]
+                    if missing:
+                        self.add_error(line, slug, {name: ['This field is required.'] for name in missing})
+                    else:
+                        rows[slug] = values
+                self.upsert(rows, existing)
+                self.record_prices(rows, existing)
+        except DatabaseError as error:
+            for slug in rows:
+                self.add_error(chunk[slug][0], slug, {'row': [str(error)]})
+            return
+
+        created = sum(slug not in existing for slug in rows)
+        self.created += created
+        self.updated += len(rows) - created
+
+    def upsert(self, rows, existing):
+        """Upsert the rows, grouped by the fields they set"""
+        groups = {}
+        for slug, values in rows.items():
+            groups.setdefault(frozenset(values), []).append(values)
+
+        for fields, group in groups.items():
+            products = []
+            for values in group:
+                product = Product(**values)
+                if product.slug in existing:
+                    # Not written on conflict, only there to satisfy the NOT
+                    # NULL constraints of the insert
+                    price, _, category_id = existing[product.slug]
+                    product.price = values.get('price', price)
+                    product.category_id = values.get('category_id', category_id)
+                products.append(product)
+            bulk_upsert(
+                Product,
+                products,
+                unique_fields=['slug'],
+                update_fields=[*sorted(fields - {'slug'}), 'updated_at'],
+                batch_size=1000
+            )
+
+    def record_prices(self, rows, existing):
+        """Record the prices of the new products and the changed prices"""
+        changed = [slug for slug, values in rows.items() if slug not in existing or (
+            'price' in values or 'price_discount' in values
+        )]
+        if not changed:
+            return
+        changes = []
+        for slug, pk, price, discount in Product.objects.filter(slug__in=changed).values_list(
+            'slug', 'pk', 'price', 'price_discount'
+        ):
+            if existing.get(slug, (None, None))[:2] != (price, discount):
+                changes.append((pk, price, discount))
+        record_price_changes(changes, timezone.now())
+
+    def get_report(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors
+        }
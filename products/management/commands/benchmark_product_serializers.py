@@ -0,0 +1,87 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from products.models import Category, Product, ProductImage
+from products.serializers import ProductListRowSerializer, ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductListSerializer with its values() fast path on a seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database, never the configured one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self._benchmark(sorted(options['sizes']), options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _benchmark(self, sizes, repeat):
+        self._seed(sizes[-1])
+        request = Request(APIRequestFactory().get('/api/v1/products/products/'))
+        context = {'request': request}
+        renderer = JSONRenderer()
+        products = Product.objects.order_by('-created_at', '-id')
+
+        def serializer_path(size):
+            queryset = products.with_main_image()[:size]
+            return renderer.render(ProductListSerializer(queryset, many=True, context=context).data)
+
+        def fast_path(size):
+            serializer = ProductListRowSerializer(context=context)
+            queryset = products.values(*serializer.get_value_fields())[:size]
+            return renderer.render(ProductListRowSerializer(queryset, many=True, context=context).data)
+
+        self.stdout.write(f'{"rows":>8} {"serializer":>12} {"fast path":>12} {"speedup":>8}')
+        for size in sizes:
+            if serializer_path(size) != fast_path(size):
+                raise CommandError(f'The fast path output differs from ProductListSerializer at {size} rows.')
+
+            slow = self._time(serializer_path, size, repeat)
+            fast = self._time(fast_path, size, repeat)
+            self.stdout.write(f'{size:>8} {slow:>11.3f}s {fast:>11.3f}s {slow / fast:>7.1f}x')
+
+    def _time(self, func, size, repeat):
+        """Return the best wall time of ``repeat`` runs"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(size)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def _seed(self, product_count):
+        # Primary keys are read back since bulk_create() does not set them on MySQL
+        Category.objects.bulk_create([
+            Category(name=f'Category {i}', slug=f'category-{i}') for i in range(20)
+        ])
+        category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                description=f'Sample product {i}',
+                price=Decimal(10 + i % 1000) + Decimal('0.5'),
+                price_discount=Decimal(5 + i % 500) if i % 3 == 0 else None,
+                stock=i % 100,
+                category_id=category_ids[i % len(category_ids)],
+            )
+            for i in range(product_count)
+        ], batch_size=1000)
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        # Every other product has an image, some have two
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=pk, image=f'products/{pk}-{n}.jpg', is_main=n == 1)
+            for pk in product_ids[::2]
+            for n in range(1 + pk % 2)
+        ], batch_size=1000)
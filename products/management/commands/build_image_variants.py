@@ -0,0 +1,55 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.images import process_image
+from products.models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+
+def _process(image_id):
+    try:
+        return process_image(image_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Build the resized variants of the product images that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild the variants of every image')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        images = ProductImage.objects.order_by('pk')
+        if not options['all']:
+            images = images.filter(variants={})
+
+        built = failed = 0
+        last_pk = 0
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                while True:
+                    image_ids = list(images.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+                    if not image_ids:
+                        break
+                    last_pk = image_ids[-1]
+                    futures = {image_id: executor.submit(_process, image_id) for image_id in image_ids}
+                    for image_id, future in futures.items():
+                        try:
+                            built += bool(future.result())
+                        except Exception as error:
+                            failed += 1
+                            self.stderr.write(f'Image {image_id}: {error}')
+        except Exception as error:
+            logger.exception('Erro inesperado em build_image_variants: %s', error)
+            raise
+
+        self.stdout.write(
+            f'{built} images processed, {failed} failed in {time.perf_counter() - start:.2f}s.'
+        )
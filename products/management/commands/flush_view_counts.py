@@ -0,0 +1,37 @@
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.view_counter import flush_all_views, flush_pending_views, uses_shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Write the product view counts buffered in the cache to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.VIEW_COUNT_FLUSH_BATCH_SIZE)
+        parser.add_argument('--all', action='store_true',
+                            help='Check the counter of every product, not only the pending ones')
+
+    def handle(self, *args, **options):
+        if not uses_shared_cache():
+            self.stdout.write("The cache is not shared, product views are written without buffering.")
+            return
+
+        batch_size = options['batch_size']
+        try:
+            if options['all']:
+                product_ids = Product.objects.values_list('pk', flat=True).iterator(chunk_size=batch_size)
+                flushed = flush_all_views(product_ids, batch_size=batch_size)
+            else:
+                flushed = flush_pending_views(batch_size=batch_size)
+        except Exception as error:
+            logger.exception('Erro inesperado em flush_view_counts: %s', error)
+            raise
+
+        if flushed is None:
+            self.stdout.write("Another process is flushing the product views.")
+        else:
+            self.stdout.write(f"Flushed {flushed} product views.")
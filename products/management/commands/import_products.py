@@ -0,0 +1,35 @@
+import logging
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import FORMATS, ProductImporter, decode, get_format
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Create or update products by slug from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or JSON Lines file')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, then csv')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        file_format = options['format'] or get_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as file:
+                importer = ProductImporter(batch_size=options['batch_size']).import_file(decode(file), file_format)
+        except OSError as error:
+            raise CommandError(error)
+        except Exception as error:
+            logger.exception('Erro inesperado em import_products: %s', error)
+            raise
+
+        for error in importer.errors:
+            messages = '; '.join(f"{field}: {' '.join(errors)}" for field, errors in error['errors'].items())
+            self.stderr.write(f"Line {error['line']} ({error['slug'] or '-'}): {messages}")
+        self.stdout.write(
+            f'{importer.created} products created, {importer.updated} updated, {importer.failed} failed '
+            f'in {time.perf_counter() - start:.2f}s.'
+        )
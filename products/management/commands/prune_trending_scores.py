@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from products.models import ProductTrendingScore
+from products.trending import log_weight
+
+
+class Command(BaseCommand):
+    help = 'Delete the trending scores that have decayed below a threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.01,
+                            help='Decayed popularity under which a score is deleted')
+        parser.add_argument('--all', action='store_true', help='Delete every score and start over')
+
+    def handle(self, *args, **options):
+        scores = ProductTrendingScore.objects.all()
+        if not options['all']:
+            # Stored scores grow with time, so the cut-off is a plain indexed comparison
+            scores = scores.filter(score__lt=log_weight(options['threshold']))
+
+        deleted, _ = scores.delete()
+        self.stdout.write(f"Deleted {deleted} trending scores.")
@@ -0,0 +1,32 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from products.pricing import get_spot_price_feed, reprice_products
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the prices of bullion products from the metal spot price feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Count the changes without writing them')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            spot_prices = get_spot_price_feed().get_spot_prices()
+            checked, updated = reprice_products(
+                spot_prices, batch_size=options['batch_size'], dry_run=options['dry_run']
+            )
+        except Exception as error:
+            logger.exception('Erro inesperado em reprice_products: %s', error)
+            raise
+
+        prices = ', '.join(f'{metal} {price}' for metal, price in sorted(spot_prices.items()))
+        action = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(
+            f"Spot prices: {prices or 'none'}. {checked} products checked, {updated} {action} "
+            f"in {time.perf_counter() - start:.2f}s."
+        )
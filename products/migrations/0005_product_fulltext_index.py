@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    # SQLite uses an FTS5 table instead, see products.search.ensure_search_index
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX products_product_fulltext ON products_product (name, description)'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX products_product_fulltext ON products_product')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
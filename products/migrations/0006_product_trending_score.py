@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrendingScore',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='products.product')),
+                ('score', models.FloatField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='products_trending_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fine_weight',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Fine metal content in troy ounces', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='metal_type',
+            field=models.CharField(blank=True, choices=[('gold', 'Gold'), ('silver', 'Silver'), ('platinum', 'Platinum'), ('palladium', 'Palladium')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='premium',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Amount added to the spot value of the metal', max_digits=10),
+        ),
+    ]
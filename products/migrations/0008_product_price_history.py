@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:10
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def seed_price_history(apps, schema_editor):
+    """Start the history of every product with its current price"""
+    Product = apps.get_model('products', 'Product')
+    ProductPrice = apps.get_model('products', 'ProductPrice')
+    ProductPriceRollup = apps.get_model('products', 'ProductPriceRollup')
+
+    now = timezone.now()
+    hour = timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+
+    products = Product.objects.values_list('pk', 'price', 'price_discount').iterator(chunk_size=1000)
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) == 1000:
+            _seed(ProductPrice, ProductPriceRollup, batch, now, hour, day)
+            batch = []
+    _seed(ProductPrice, ProductPriceRollup, batch, now, hour, day)
+
+
+def _seed(ProductPrice, ProductPriceRollup, products, now, hour, day):
+    ProductPrice.objects.bulk_create([
+        ProductPrice(product_id=pk, price=price, price_discount=discount, recorded_at=now)
+        for pk, price, discount in products
+    ])
+    ProductPriceRollup.objects.bulk_create([
+        ProductPriceRollup(product_id=pk, resolution=resolution, bucket=bucket,
+                           open=price, high=price, low=price, close=price)
+        for pk, price, _ in products
+        for resolution, bucket in (('hour', hour), ('day', day))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_metal_pricing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='products.product')),
+            ],
+            options={
+                'unique_together': {('product', 'resolution', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_discount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'recorded_at'], name='products_price_history_idx')],
+            },
+        ),
+        migrations.RunPython(seed_price_history, migrations.RunPython.noop),
+    ]
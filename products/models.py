@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from django.utils.text import slugify
 from core.models import TimeStampedModel
 
@@ -25,10 +27,60 @@ class Category(TimeStampedModel):
         super().save(*args, **kwargs)
 
 
+def main_image_prefetch(lookup='images'):
+    """
+    Prefetch only the main image of each product into ``main_images``.
+
+    The main image is the one flagged ``is_main``, falling back to the oldest
+    image. The slice is resolved with a window function, so a whole page of
+    products costs a single query.
+    """
+    return Prefetch(
+        lookup,
+        queryset=ProductImage.objects.order_by('-is_main', 'created_at', 'id')[:1],
+        to_attr='main_images'
+    )
+
+
+def main_image_values(product_ids, fields=('id', 'product_id', 'image', 'alt_text', 'variants')):
+    """
+    Return the ``values()`` of the main image of each product, keyed on the
+    product id, with the same choice of image as main_image_prefetch()
+    """
+    rank = Window(
+        RowNumber(),
+        partition_by=F('product_id'),
+        order_by=[F('is_main').desc(), F('created_at').asc(), F('id').asc()]
+    )
+    images = (
+        ProductImage.objects.filter(product_id__in=product_ids)
+        .annotate(image_rank=rank)
+        .filter(image_rank=1)
+        .values(*fields)
+    )
+    return {image['product_id']: image for image in images}
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_main_image(self):
+        """Load everything ProductListSerializer needs in a fixed number of queries"""
+        return self.select_related('category').prefetch_related(main_image_prefetch())
+
+
 class Product(TimeStampedModel):
     """
     Product model
+
+    Bullion products with a metal type and a fine weight are repriced from
+    the metal spot price plus their premium, see products.pricing.
     """
+    METAL_CHOICES = (
+        ('gold', 'Gold'),
+        ('silver', 'Silver'),
+        ('platinum', 'Platinum'),
+        ('palladium', 'Palladium'),
+    )
+
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField()
@@ -40,13 +92,43 @@ class Product(TimeStampedModel):
     featured = models.BooleanField(default=False)
     sales_count = models.PositiveIntegerField(default=0)
     view_count = models.PositiveIntegerField(default=0)
+    metal_type = models.CharField(max_length=20, choices=METAL_CHOICES, blank=True, default='')
+    fine_weight = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True,
+                                      help_text='Fine metal content in troy ounces')
+    premium = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                  help_text='Amount added to the spot value of the metal')
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        # Listings are keyset paginated on (ordering field, created_at, id)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='products_newest_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='products_category_newest_idx'),
+            models.Index(fields=['available', 'featured', '-created_at', '-id'], name='products_available_newest_idx'),
+            models.Index(fields=['price', '-created_at', '-id'], name='products_price_idx'),
+            models.Index(fields=['-sales_count', '-created_at', '-id'], name='products_sales_idx'),
+            models.Index(fields=['-view_count', '-created_at', '-id'], name='products_views_idx'),
+            # Cover the MAX(updated_at)/COUNT aggregate behind conditional GETs
+            models.Index(fields=['updated_at'], name='products_updated_idx'),
+            models.Index(fields=['available', 'featured', 'updated_at'], name='products_available_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to record price changes in the price history
+        instance._loaded_prices = instance.get_loaded_prices()
+        return instance
+
+    def get_loaded_prices(self):
+        """Return the price and discount price, None when not loaded"""
+        return self.__dict__.get('price'), self.__dict__.get('price_discount')
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -61,9 +143,83 @@ class ProductImage(TimeStampedModel):
     image = models.ImageField(upload_to='products/')
     alt_text = models.CharField(max_length=200, blank=True, null=True)
     is_main = models.BooleanField(default=False)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Resized copies built by products.images, {name: {width, height, webp, jpeg}}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['is_main', 'created_at']
 
     def __str__(self):
         return f"Image for {self.product.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered to rebuild the variants when the file is replaced
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+
+class ProductTrendingScore(models.Model):
+    """
+    Time-decayed popularity of a product, see products.trending.
+
+    The score is the log of the decayed event weights scaled to a fixed epoch,
+    so it grows instead of decaying and rows only change on new events.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='products_trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trending score for {self.product_id}"
+
+
+class ProductPrice(models.Model):
+    """
+    Append-only history of product prices, one row per change
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_discount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'recorded_at'], name='products_price_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} at {self.price} on {self.recorded_at}"
+
+
+class ProductPriceRollup(models.Model):
+    """
+    Open, high, low and close price of a product per hour or per day
+    """
+    RESOLUTION_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        # Serves the range scans of the price history charts
+        unique_together = ('product', 'resolution', 'bucket')
+
+    def __str__(self):
+        return f"{self.product_id} {self.resolution} {self.bucket}"
@@ -0,0 +1,122 @@
+"""
+Product price history.
+
+Every price change is appended to ProductPrice and merged into the hourly and
+daily ProductPriceRollup rows of its product (open, high, low, close), so a
+chart of any period is read from a single range scan of a few hundred rows,
+however many raw changes were recorded.
+"""
+
+from datetime import timedelta
+from django.db.models import Case, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from .models import ProductPrice, ProductPriceRollup
+
+# Ranges up to these lengths are served raw, then hourly, then daily
+RAW_MAX_RANGE = timedelta(days=2)
+HOURLY_MAX_RANGE = timedelta(days=90)
+
+RESOLUTIONS = ('raw', 'hour', 'day')
+ROLLUP_BATCH_SIZE = 500
+
+
+def truncate(moment, resolution):
+    """Return the start of the hour or local day containing ``moment``"""
+    moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def record_price_changes(changes, recorded_at=None):
+    """
+    Append ``(product id, price, discount price)`` changes to the history and
+    merge them into the rollups, with a fixed number of queries per batch
+    """
+    changes = {product_id: (price, discount) for product_id, price, discount in changes}
+    if not changes:
+        return
+    recorded_at = recorded_at or timezone.now()
+
+    ProductPrice.objects.bulk_create([
+        ProductPrice(product_id=product_id, price=price, price_discount=discount, recorded_at=recorded_at)
+        for product_id, (price, discount) in changes.items()
+    ], batch_size=1000)
+
+    price_field = ProductPriceRollup._meta.get_field('close')
+    for resolution, _ in ProductPriceRollup.RESOLUTION_CHOICES:
+        bucket = truncate(recorded_at, resolution)
+        # Open the missing buckets, the open price of an existing one is kept
+        ProductPriceRollup.objects.bulk_create([
+            ProductPriceRollup(
+                product_id=product_id, resolution=resolution, bucket=bucket,
+                open=price, high=price, low=price, close=price
+            )
+            for product_id, (price, _) in changes.items()
+        ], ignore_conflicts=True, batch_size=1000)
+
+        # Merged in the UPDATE itself, so concurrent changes are never lost
+        for chunk in _chunks(list(changes), ROLLUP_BATCH_SIZE):
+            # One WHEN per distinct price, new prices are often shared
+            by_price = {}
+            for product_id in chunk:
+                by_price.setdefault(changes[product_id][0], []).append(product_id)
+            prices = Case(
+                *[
+                    When(product_id__in=ids, then=Value(price)) if len(ids) > 1
+                    else When(product_id=ids[0], then=Value(price))
+                    for price, ids in by_price.items()
+                ],
+                output_field=price_field
+            )
+            ProductPriceRollup.objects.filter(
+                resolution=resolution, bucket=bucket, product_id__in=chunk
+            ).update(high=Greatest('high', prices), low=Least('low', prices), close=prices)
+
+
+def choose_resolution(start, end):
+    """Return the coarsest resolution that still shows the range in detail"""
+    if end - start <= RAW_MAX_RANGE:
+        return 'raw'
+    if end - start <= HOURLY_MAX_RANGE:
+        return 'hour'
+    return 'day'
+
+
+def price_series(product_id, start, end, resolution=None):
+    """
+    Return ``(resolution, columns, rows)`` of the price history of a product
+    between ``start`` and ``end``, oldest first. The last price known at the
+    start of the range opens the series, so a price that has not changed in
+    the range is still charted.
+    """
+    resolution = resolution or choose_resolution(start, end)
+    if resolution == 'raw':
+        columns = ['time', 'price', 'price_discount']
+        history = ProductPrice.objects.filter(product_id=product_id).order_by('recorded_at')
+        rows = list(history.filter(
+            recorded_at__gte=start, recorded_at__lt=end
+        ).values_list('recorded_at', 'price', 'price_discount'))
+        if not rows or rows[0][0] > start:
+            previous = history.filter(recorded_at__lt=start).values_list('price', 'price_discount').last()
+            if previous:
+                rows.insert(0, (start, *previous))
+    else:
+        columns = ['time', 'open', 'high', 'low', 'close']
+        first_bucket = truncate(start, resolution)
+        history = ProductPriceRollup.objects.filter(product_id=product_id, resolution=resolution).order_by('bucket')
+        # Include the bucket that contains the start of the range
+        rows = list(history.filter(
+            bucket__gte=first_bucket, bucket__lt=end
+        ).values_list('bucket', 'open', 'high', 'low', 'close'))
+        if not rows or rows[0][0] > first_bucket:
+            close = history.filter(bucket__lt=first_bucket).values_list('close', flat=True).last()
+            if close is not None:
+                rows.insert(0, (first_bucket, close, close, close, close))
+    return resolution, columns, rows
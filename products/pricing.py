@@ -0,0 +1,181 @@
+"""
+Repricing of bullion products from metal spot prices.
+
+The price of a product with a metal type and a fine weight is
+``spot price x fine weight + premium``. When it carries a discount price, the
+discount keeps the same ratio to the price. Prices are computed with NumPy on
+integer cents, so a batch is repriced without Decimal arithmetic per row and
+without float rounding errors. Products are locked, read and written back
+in primary key chunks, each in its own short transaction, and only the rows
+whose prices changed are updated with one UPDATE ... CASE per batch and
+recorded in the price history.
+"""
+
+import json
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Product
+from .price_history import record_price_changes
+from .signals import invalidate_catalog_cache
+
+CENTS = Decimal('0.01')
+WEIGHT_SCALE = 10 ** 4  # Product.fine_weight has 4 decimal places
+UPDATE_BATCH_SIZE = 250
+
+
+class SpotPriceFeed:
+    """Base class of the spot price feeds, returning prices per troy ounce"""
+
+    def __init__(self, location=None):
+        self.location = location or settings.SPOT_PRICE_FEED_LOCATION
+
+    def fetch(self):
+        raise NotImplementedError
+
+    def get_spot_prices(self):
+        """Return ``{metal: Decimal price}`` for the known metals found in the feed"""
+        metals = {metal for metal, _ in Product.METAL_CHOICES}
+        prices = {}
+        for metal, price in self.fetch().items():
+            if metal in metals and price is not None:
+                prices[metal] = Decimal(str(price)).quantize(CENTS, rounding=ROUND_HALF_UP)
+        return prices
+
+
+class FileSpotPriceFeed(SpotPriceFeed):
+    """Reads a JSON object such as ``{"gold": 2345.10, "silver": 29.85}`` from a local file"""
+
+    def fetch(self):
+        with open(self.location) as file:
+            return json.load(file)
+
+
+class HttpSpotPriceFeed(SpotPriceFeed):
+    """Fetches the same JSON object from a URL"""
+    timeout = 10
+
+    def fetch(self):
+        response = requests.get(self.location, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def get_spot_price_feed():
+    """Return the feed configured in SPOT_PRICE_FEED"""
+    return import_string(settings.SPOT_PRICE_FEED)()
+
+
+def _to_cents(values):
+    return np.array([int(value * 100) if value is not None else -1 for value in values], dtype=np.int64)
+
+
+def compute_prices(metal_types, weights, premiums, prices, discounts, spot_prices):
+    """
+    Return the new ``(prices, discounts)`` in cents of a batch of products.
+
+    Arguments are arrays: metal types, fine weights in 1/10000 ounce, and the
+    premiums, current prices and discount prices in cents (-1 for no discount).
+    """
+    metals, codes = np.unique(np.asarray(metal_types), return_inverse=True)
+    spot = np.array([int(spot_prices.get(metal, 0) * 100) for metal in metals], dtype=np.int64)[codes.reshape(-1)]
+    # cents x 1/10000 oz, rounded half up back to cents
+    new_prices = np.maximum((spot * weights + WEIGHT_SCALE // 2) // WEIGHT_SCALE + premiums, 0)
+
+    has_discount = (discounts >= 0) & (prices > 0)
+    safe_prices = np.where(has_discount, prices, 1)
+    new_discounts = np.where(
+        has_discount,
+        (2 * new_prices * discounts + safe_prices) // (2 * safe_prices),
+        -1
+    )
+    return new_prices, new_discounts
+
+
+def _per_product(changes, index, name):
+    """CASE mapping each primary key of ``changes`` to its value at ``index``"""
+    field = Product._meta.get_field(name)
+    return Case(
+        *[When(pk=change[0], then=Value(change[index], output_field=field)) for change in changes],
+        default=F(name),
+        output_field=field
+    )
+
+
+def _update_prices(changes, now):
+    """Write ``(pk, price, discount)`` rows with a single UPDATE ... CASE"""
+    Product.objects.filter(pk__in=[pk for pk, _, _ in changes]).update(
+        price=_per_product(changes, 1, 'price'),
+        price_discount=_per_product(changes, 2, 'price_discount'),
+        updated_at=now
+    )
+
+
+def reprice_products(spot_prices, batch_size=2000, dry_run=False):
+    """
+    Reprice every product with a metal type and a fine weight from
+    ``spot_prices``. Returns ``(products checked, products updated)``.
+    """
+    checked = updated = 0
+    if not spot_prices:
+        return checked, updated
+
+    priced = Product.objects.filter(metal_type__in=list(spot_prices), fine_weight__isnull=False).order_by('pk')
+    if not dry_run:
+        # Rows are locked in primary key order, like the other bulk writers
+        priced = priced.select_for_update()
+    last_pk = 0
+    while True:
+        # One short transaction per chunk, so readers and checkouts are never
+        # blocked for the whole catalog; the chunk is read and written in it,
+        # so a concurrent price change is never overwritten
+        with transaction.atomic():
+            rows = list(
+                priced.filter(pk__gt=last_pk).values_list(
+                    'pk', 'metal_type', 'fine_weight', 'premium', 'price', 'price_discount'
+                )[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            checked += len(rows)
+
+            pks, metal_types, weights, premiums, prices, discounts = zip(*rows)
+            prices = _to_cents(prices)
+            discounts = _to_cents(discounts)
+            new_prices, new_discounts = compute_prices(
+                metal_types,
+                np.array([int(weight * WEIGHT_SCALE) for weight in weights], dtype=np.int64),
+                _to_cents(premiums),
+                prices,
+                discounts,
+                spot_prices
+            )
+
+            changed = np.flatnonzero((new_prices != prices) | (new_discounts != discounts))
+            if not len(changed) or dry_run:
+                updated += len(changed)
+                continue
+
+            changes = [
+                (
+                    pks[i],
+                    Decimal(int(new_prices[i])) / 100,
+                    Decimal(int(new_discounts[i])) / 100 if new_discounts[i] >= 0 else None
+                )
+                for i in changed.tolist()
+            ]
+            now = timezone.now()
+            for start in range(0, len(changes), UPDATE_BATCH_SIZE):
+                _update_prices(changes[start:start + UPDATE_BATCH_SIZE], now)
+            record_price_changes(changes, now)
+            updated += len(changes)
+
+    if updated and not dry_run:
+        invalidate_catalog_cache()
+    return checked, updated
@@ -0,0 +1,149 @@
+"""
+Full-text search backends for products.
+
+MySQL uses a FULLTEXT index over (name, description) and SQLite an FTS5 table
+kept in sync with triggers. Both rank results by relevance through the
+``search_rank`` annotation. Other databases fall back to LIKE lookups.
+"""
+
+import logging
+import re
+from functools import reduce
+from operator import and_
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'products_product_fts'
+
+SQLITE_SEARCH_INDEX_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, content='products_product', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, description ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+
+def ensure_search_index(sender=None, using='default', **kwargs):
+    """
+    Create the SQLite FTS5 table and its triggers when missing.
+
+    Connected to post_migrate because SQLite drops the triggers whenever a
+    migration rebuilds the products table; the index is then rebuilt.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE %s",
+            [f'{FTS_TABLE}%']
+        )
+        existing = cursor.fetchone()[0]
+        try:
+            for statement in SQLITE_SEARCH_INDEX_SQL:
+                cursor.execute(statement)
+        except Exception:
+            logger.warning('SQLite FTS5 is not available, product search falls back to LIKE lookups')
+            return
+
+        # Something was (re)created, so the index may have missed changes
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE %s",
+            [f'{FTS_TABLE}%']
+        )
+        if cursor.fetchone()[0] != existing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def get_search_terms(search_terms):
+    """Reduce the search terms to plain words, safe for any full-text syntax"""
+    return [word for term in search_terms for word in re.findall(r'\w+', term)]
+
+
+class LikeSearchBackend:
+    """Case-insensitive LIKE lookups, unranked"""
+
+    def search(self, queryset, terms):
+        conditions = [Q(name__icontains=term) | Q(description__icontains=term) for term in terms]
+        return queryset.filter(reduce(and_, conditions))
+
+
+class MySQLFullTextBackend:
+    """Boolean mode MATCH ... AGAINST over the (name, description) FULLTEXT index"""
+
+    def search(self, queryset, terms):
+        query = ' '.join(f'+{term}*' for term in terms)
+        table = Product._meta.db_table
+        rank = RawSQL(
+            f'MATCH ({table}.name, {table}.description) AGAINST (%s IN BOOLEAN MODE)',
+            [query],
+            output_field=FloatField()
+        )
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0).order_by('-search_rank')
+
+
+class SQLiteFTS5Backend:
+    """FTS5 MATCH ranked with bm25, weighting the name above the description"""
+
+    def search(self, queryset, terms):
+        query = ' '.join(f'"{term}"*' for term in terms)
+        table = Product._meta.db_table
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query])
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id',
+            [query],
+            output_field=FloatField()
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank).order_by('-search_rank')
+
+
+def _sqlite_has_search_index():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def get_search_backend():
+    """
+    Return the backend configured in PRODUCT_SEARCH_BACKEND, or the native
+    full-text backend of the database in use
+    """
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'mysql':
+        return MySQLFullTextBackend()
+    if connection.vendor == 'sqlite' and _sqlite_has_search_index():
+        return SQLiteFTS5Backend()
+    return LikeSearchBackend()
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` filter served by the product search backend, ordered by
+    relevance unless an explicit ``?ordering=`` is given
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = get_search_terms(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        return get_search_backend().search(queryset, terms)
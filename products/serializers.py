@@ -1,14 +1,43 @@
+from itertools import islice
+from operator import itemgetter
+from urllib.parse import urlencode
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Category, Product, ProductImage
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from core.pagination import KeysetCursorPagination
+from core.serializers import SparseFieldsetMixin
+from .images import image_srcset
+from .models import Category, Product, ProductImage, main_image_values
 
 
-class ProductImageSerializer(serializers.ModelSerializer):
+def get_srcset(variants, storage, request=None, image_format='webp'):
+    """Return the srcset of the image variants, with absolute URLs when there is a request"""
+    def url(name):
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return image_srcset(variants, url, image_format)
+
+
+class ProductImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+    # For the clients that do not decode WebP
+    srcset_jpeg = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_main']
+        fields = ['id', 'image', 'alt_text', 'is_main', 'width', 'height', 'srcset', 'srcset_jpeg']
+        read_only_fields = ['width', 'height']
+
+    def get_srcset(self, obj):
+        return get_srcset(obj.variants, obj.image.storage, self.context.get('request'))
 
+    def get_srcset_jpeg(self, obj):
+        return get_srcset(obj.variants, obj.image.storage, self.context.get('request'), 'jpeg')
 
-class ProductListSerializer(serializers.ModelSerializer):
+
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     main_image = serializers.SerializerMethodField()
     category_name = serializers.ReadOnlyField(source='category.name')
 
@@ -18,9 +47,11 @@ class ProductListSerializer(serializers.ModelSerializer):
                   'main_image', 'sales_count', 'view_count']
 
     def get_main_image(self, obj):
-        main_image = obj.images.filter(is_main=True).first()
-        if not main_image:
-            main_image = obj.images.first()
+        # Use the image loaded by main_image_prefetch() when available
+        main_images = getattr(obj, 'main_images', None)
+        if main_images is None:
+            main_images = obj.images.order_by('-is_main', 'created_at', 'id')[:1]
+        main_image = next(iter(main_images), None)
 
         if main_image:
             request = self.context.get('request')
@@ -31,12 +62,108 @@ class ProductListSerializer(serializers.ModelSerializer):
             return {
                 'id': main_image.id,
                 'image': image_url,
-                'alt_text': main_image.alt_text
+                'alt_text': main_image.alt_text,
+                'srcset': get_srcset(main_image.variants, main_image.image.storage, request),
+                'srcset_jpeg': get_srcset(main_image.variants, main_image.image.storage, request, 'jpeg')
             }
         return None
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductListRowSerializer:
+    """
+    Read-only fast path of ProductListSerializer over ``values()`` rows.
+
+    Every field is resolved once into an accessor on the row, so products are
+    serialized without per-object serializer or field work. The rendered JSON
+    is identical to ProductListSerializer's, sparse fieldsets included.
+    """
+    serializer_class = ProductListSerializer
+    # Fields whose to_representation() returns the database value unchanged
+    passthrough_fields = (
+        serializers.BooleanField, serializers.CharField, serializers.IntegerField,
+        serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField
+    )
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.fields = self.serializer_class(context=self.context).fields
+        self.accessors = [(name, self.get_accessor(field)) for name, field in self.fields.items()]
+        self.image_storage = ProductImage._meta.get_field('image').storage
+        self.main_images = {}
+
+    def get_value_fields(self):
+        """Return the ``values()`` lookups the rendered fields read"""
+        lookups = ['id']
+        for field in self.fields.values():
+            if not isinstance(field, serializers.SerializerMethodField):
+                lookups.append('__'.join(field.source_attrs))
+        return list(dict.fromkeys(lookups))
+
+    def get_accessor(self, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            return getattr(self, field.method_name)
+
+        lookup = '__'.join(field.source_attrs)
+        if isinstance(field, self.passthrough_fields):
+            return itemgetter(lookup)
+
+        to_representation = field.to_representation
+
+        def accessor(row):
+            value = row[lookup]
+            return None if value is None else to_representation(value)
+        return accessor
+
+    def get_main_image(self, row):
+        main_image = self.main_images.get(row['id'])
+        if main_image is None:
+            return None
+
+        request = self.context.get('request')
+        image_url = self.image_storage.url(main_image['image']) if main_image['image'] else None
+        if request is not None and image_url:
+            image_url = request.build_absolute_uri(image_url)
+
+        return {
+            'id': main_image['id'],
+            'image': image_url,
+            'alt_text': main_image['alt_text'],
+            'srcset': get_srcset(main_image['variants'], self.image_storage, request),
+            'srcset_jpeg': get_srcset(main_image['variants'], self.image_storage, request, 'jpeg')
+        }
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        if 'main_image' in self.fields:
+            self.main_images = main_image_values([row['id'] for row in rows])
+        accessors = self.accessors
+        return [{name: accessor(row) for name, accessor in accessors} for row in rows]
+
+    @property
+    def data(self):
+        if self.many:
+            return ReturnList(self.to_representation(self.instance), serializer=self)
+        return ReturnDict(self.to_representation([self.instance])[0], serializer=self)
+
+    def iter_json(self, rows, chunk_size=1000):
+        """
+        Yield the rows as one JSON array, chunk by chunk, rendered exactly like
+        JSONRenderer renders the whole list
+        """
+        renderer = JSONRenderer()
+        rows = iter(rows)
+        separator = b''
+        yield b'['
+        while chunk := list(islice(rows, chunk_size)):
+            # Drop the brackets of each chunk so that they join into a single array
+            yield separator + renderer.render(self.to_representation(chunk))[1:-1]
+            separator = b','
+        yield b']'
+
+
+class ProductDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     category_name = serializers.ReadOnlyField(source='category.name')
 
@@ -44,24 +171,79 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'slug', 'description', 'price', 'price_discount', 'stock', 'available',
                   'category', 'category_name', 'featured', 'images', 'created_at', 'updated_at', 'sales_count',
-                  'view_count']
+                  'view_count', 'metal_type', 'fine_weight', 'premium']
 
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['name', 'description', 'price', 'price_discount', 'stock', 'available', 'category', 'featured']
+        fields = ['name', 'description', 'price', 'price_discount', 'stock', 'available', 'category', 'featured',
+                  'metal_type', 'fine_weight', 'premium']
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """Changes of one product in a bulk update, ``stock_delta`` is added to the current stock"""
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    price_discount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, allow_null=True,
+                                              required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    stock_delta = serializers.IntegerField(required=False)
+    available = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('No changes were given.')
+        if 'stock' in attrs and 'stock_delta' in attrs:
+            raise serializers.ValidationError({'stock_delta': 'Can not be combined with stock.'})
+        return attrs
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'image']
 
 
-class CategoryDetailSerializer(serializers.ModelSerializer):
-    products = ProductListSerializer(many=True, read_only=True)
+class CategoryDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Embeds the newest CATEGORY_PRODUCTS_PREVIEW_SIZE products of the category
+    and a cursor link to the product listing for the rest.
+    """
+    products = serializers.SerializerMethodField()
+    products_next = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'image', 'products']
+        fields = ['id', 'name', 'slug', 'description', 'image', 'products', 'products_next']
+
+    def get_preview_products(self, obj):
+        # Use the products loaded by CategoryViewSet when available, one extra
+        # product tells whether there are more
+        products = getattr(obj, 'preview_products', None)
+        if products is None:
+            size = settings.CATEGORY_PRODUCTS_PREVIEW_SIZE
+            products = list(obj.products.with_main_image().order_by('-created_at', '-id')[:size + 1])
+            obj.preview_products = products
+        return products
+
+    def get_products(self, obj):
+        products = self.get_preview_products(obj)[:settings.CATEGORY_PRODUCTS_PREVIEW_SIZE]
+        return ProductListSerializer(
+            products, many=True, context=self.context, sparse_fieldset=self.get_nested_fieldset('products')
+        ).data
+
+    def get_products_next(self, obj):
+        products = self.get_preview_products(obj)
+        size = settings.CATEGORY_PRODUCTS_PREVIEW_SIZE
+        if len(products) <= size:
+            return None
+
+        pagination = KeysetCursorPagination()
+        position = pagination.get_position(products[size - 1], pagination.default_ordering)
+        query = urlencode({'category': obj.pk, pagination.cursor_query_param: pagination.encode_cursor(position)})
+        url = f"{reverse('products:product-list')}?{query}"
+
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return url
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.cache import bump_cache_version
+from .models import Category, Product, ProductImage
+from .price_history import record_price_changes
+
+CATALOG_CACHE_NAMESPACE = 'catalog'
+
+
+def invalidate_catalog_cache():
+    """
+    Invalidate the cached category and product responses once the current
+    transaction commits
+    """
+    transaction.on_commit(lambda: bump_cache_version(CATALOG_CACHE_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+def catalog_changed(sender, **kwargs):
+    """
+    Signal to invalidate the catalog cache when a category, product or image changes
+    """
+    invalidate_catalog_cache()
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created, **kwargs):
+    """
+    Signal to record new products and price changes, including admin edits,
+    in the price history
+    """
+    prices = instance.get_loaded_prices()
+    if created or prices != getattr(instance, '_loaded_prices', (None, None)):
+        record_price_changes([(instance.pk, instance.price, instance.price_discount)])
+        instance._loaded_prices = instance.get_loaded_prices()
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from .models import Category, Product, ProductPrice, ProductPriceRollup
+from .price_history import price_series, record_price_changes
+
+
+class PriceSeriesTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Gold', slug='gold')
+        self.product = Product.objects.create(
+            name='Gold bar', slug='gold-bar', description='A gold bar', price=Decimal('100.00'), category=category
+        )
+        # Priced once, long before the charted ranges
+        ProductPrice.objects.all().delete()
+        ProductPriceRollup.objects.all().delete()
+        self.priced_at = timezone.make_aware(datetime(2019, 6, 1, 12))
+        record_price_changes([(self.product.pk, Decimal('100.00'), Decimal('90.00'))], self.priced_at)
+
+    def test_stable_price_is_carried_into_the_range(self):
+        start = timezone.make_aware(datetime(2020, 1, 1))
+        end = timezone.make_aware(datetime(2020, 2, 1))
+        for resolution, row in (
+            ('raw', [start, Decimal('100.00'), Decimal('90.00')]),
+            ('hour', [start, *[Decimal('100.00')] * 4]),
+            ('day', [start, *[Decimal('100.00')] * 4]),
+        ):
+            with self.subTest(resolution=resolution):
+                _, _, rows = price_series(self.product.pk, start, end, resolution)
+                self.assertEqual([list(rows[0])], [row])
+                self.assertEqual(len(rows), 1)
+
+    def test_carried_price_opens_the_changes_in_the_range(self):
+        start = timezone.make_aware(datetime(2020, 1, 1))
+        changed_at = start + timedelta(days=3, hours=5)
+        record_price_changes([(self.product.pk, Decimal('120.00'), None)], changed_at)
+
+        _, _, rows = price_series(self.product.pk, start, start + timedelta(days=10), 'day')
+        self.assertEqual([row[0] for row in rows], [start, timezone.localtime(changed_at).replace(hour=0)])
+        self.assertEqual(rows[0][4], Decimal('100.00'))
+        self.assertEqual(rows[1][4], Decimal('120.00'))
+
+    def test_no_point_before_the_first_price(self):
+        start = timezone.make_aware(datetime(2019, 1, 1))
+        _, _, rows = price_series(self.product.pk, start, start + timedelta(days=30), 'day')
+        self.assertEqual(rows, [])
@@ -0,0 +1,91 @@
+"""
+Time-decayed trending scores.
+
+An event of weight ``w`` at time ``t`` is worth ``w * exp(-k * (now - t))``
+with ``k = ln(2) / TRENDING_HALF_LIFE``. All the events of a product decay by
+the same factor, so instead of decaying every score the weights are scaled up
+to a fixed epoch: the stored score is ``log(sum(w * exp(k * (t - EPOCH))))``.
+New events are added in log space (log-sum-exp) by one UPDATE per batch, and
+ordering by the stored score is ordering by the current decayed popularity.
+
+Changing TRENDING_HALF_LIFE makes the existing scores inconsistent; run
+``prune_trending_scores --all`` to start over.
+"""
+
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+from .models import Product, ProductTrendingScore
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def decay_rate():
+    """Return ``k``, per second"""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE * 3600)
+
+
+def log_weight(weight, when=None):
+    """Return the stored score of a single event of ``weight`` at ``when``"""
+    when = when or timezone.now()
+    return math.log(weight) + decay_rate() * (when - EPOCH).total_seconds()
+
+
+def current_score(score, now=None):
+    """Return the decayed popularity a stored score stands for at ``now``"""
+    if score is None:
+        return 0.0
+    return math.exp(score - log_weight(1, now))
+
+
+def record_trending_events(counts, weight, when=None):
+    """
+    Add events to the trending scores, ``counts`` maps product ids to the
+    number of events of ``weight`` each.
+    """
+    increments = {
+        product_id: log_weight(weight * count, when)
+        for product_id, count in counts.items() if count > 0
+    }
+    if not increments or weight <= 0:
+        return
+
+    with transaction.atomic():
+        product_ids = Product.objects.filter(pk__in=increments).values_list('pk', flat=True)
+        ProductTrendingScore.objects.bulk_create(
+            [ProductTrendingScore(product_id=product_id) for product_id in product_ids],
+            ignore_conflicts=True
+        )
+
+        incoming = Case(
+            *[When(pk=product_id, then=Value(value)) for product_id, value in increments.items()],
+            output_field=FloatField()
+        )
+        # log(exp(a) + exp(b)) computed as max(a, b) + log(1 + exp(-|a - b|))
+        log_sum = Greatest(F('score'), incoming) + Ln(Value(1.0) + Exp(-Abs(F('score') - incoming)))
+        ProductTrendingScore.objects.filter(pk__in=increments).update(
+            score=Case(When(score__isnull=True, then=incoming), default=log_sum, output_field=FloatField()),
+            updated_at=timezone.now()
+        )
+
+
+def record_sales(quantities):
+    """Add the units sold per product once the transaction commits"""
+    quantities = dict(quantities)
+    when = timezone.now()
+    transaction.on_commit(
+        lambda: record_trending_events(quantities, settings.TRENDING_SALE_WEIGHT, when)
+    )
+
+
+def trending_product_ids(limit):
+    """Return the ids of the ``limit`` most trending available products, top first"""
+    return list(
+        ProductTrendingScore.objects.filter(score__isnull=False, product__available=True)
+        .order_by('-score')
+        .values_list('product_id', flat=True)[:limit]
+    )
@@ -0,0 +1,253 @@
+"""
+Write-behind buffer for product view counts.
+
+Views are counted in the cache and periodically written to the database with a
+single ``F()`` based UPDATE per batch, so product page views do not write rows.
+Each flush also moves ``updated_at`` of the products and invalidates the
+catalog cache, so the ETags and cached responses show the new counts.
+
+Everything lives in the cache, which must be shared by every process: the
+per-product counters and a log of the products with unflushed views. Any web
+worker or the ``flush_view_counts`` command can flush them, one at a time
+under a cache lock, and nothing is lost when a worker is recycled. With a
+cache that can not be shared safely, each view is written right away and
+the viewed products are refreshed in the same way on the flush schedule.
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Warning, register
+from django.db import connections
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import Product
+from .signals import invalidate_catalog_cache
+from .trending import record_trending_events
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'products:view_count:'
+# Log of the products with unflushed views: slots 1..SEQUENCE hold product
+# ids, the ones up to FLUSHED have been flushed
+PENDING_KEY_PREFIX = 'products:view_count:pending:'
+SEQUENCE_KEY = 'products:view_count:sequence'
+FLUSHED_KEY = 'products:view_count:flushed'
+LOCK_KEY = 'products:view_count:lock'
+LOCK_TIMEOUT = 300  # seconds
+
+# Caches that are private to each process, or whose incr() and add() are
+# not atomic across processes
+UNSHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+
+def _cache_key(product_id):
+    return f'{CACHE_KEY_PREFIX}{product_id}'
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def uses_shared_cache():
+    return settings.CACHES['default']['BACKEND'] not in UNSHARED_CACHE_BACKENDS
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Without a shared cache every product view is an UPDATE"""
+    if uses_shared_cache():
+        return []
+    return [Warning(
+        'The cache backend can not be shared by the processes, product views are written one at a time.',
+        hint='Set CACHE_BACKEND to a shared cache such as Memcached or Redis.',
+        id='products.W001'
+    )]
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Missing or evicted
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def mark_pending(product_id):
+    """Append a product to the log of products with unflushed views"""
+    cache.set(f'{PENDING_KEY_PREFIX}{_incr(SEQUENCE_KEY)}', product_id, timeout=None)
+
+
+def write_view(product_id):
+    """Count a view straight in the database, see refresh_viewed()"""
+    Product.objects.filter(pk=product_id).update(view_count=F('view_count') + 1)
+    record_trending_events({product_id: 1}, settings.TRENDING_VIEW_WEIGHT)
+
+
+def refresh_viewed(product_ids):
+    """
+    Move ``updated_at`` of products whose views were written directly and
+    invalidate the catalog cache, so their new counts are served
+    """
+    if product_ids:
+        Product.objects.filter(pk__in=list(product_ids)).update(updated_at=timezone.now())
+        invalidate_catalog_cache()
+    return len(product_ids)
+
+
+def record_view(product_id):
+    """Count a view, the first view since the last flush marks the product pending"""
+    if _incr(_cache_key(product_id)) == 1:
+        mark_pending(product_id)
+
+
+def flush_view_counts(product_ids, batch_size=None):
+    """
+    Write the buffered view counts of the given products to the database.
+
+    Must be called while holding the flush lock. Returns the number of views
+    written.
+    """
+    batch_size = batch_size or settings.VIEW_COUNT_FLUSH_BATCH_SIZE
+    flushed = 0
+
+    for chunk in _chunks(list(product_ids), batch_size):
+        keys = {_cache_key(product_id): product_id for product_id in chunk}
+        counts = {key: value for key, value in cache.get_many(keys).items() if value and value > 0}
+        if not counts:
+            continue
+
+        increments = Case(
+            *[When(pk=keys[key], then=Value(value)) for key, value in counts.items()],
+            default=Value(0)
+        )
+        Product.objects.filter(pk__in=[keys[key] for key in counts]).update(
+            view_count=F('view_count') + increments, updated_at=timezone.now()
+        )
+        record_trending_events(
+            {keys[key]: value for key, value in counts.items()}, settings.TRENDING_VIEW_WEIGHT
+        )
+
+        # Subtract what was written instead of deleting the keys, so views
+        # recorded while flushing are kept; their products are pending again
+        # since their first view after the flush did not mark them
+        for key, value in counts.items():
+            try:
+                if cache.decr(key, value) > 0:
+                    mark_pending(keys[key])
+            except ValueError:
+                pass
+        flushed += sum(counts.values())
+
+    if flushed:
+        invalidate_catalog_cache()
+    return flushed
+
+
+def flush_pending_views(batch_size=None):
+    """
+    Flush the products marked pending since the last flush, unless another
+    process is flushing. Returns the number of views written, None when the
+    flush lock is taken.
+    """
+    batch_size = batch_size or settings.VIEW_COUNT_FLUSH_BATCH_SIZE
+    if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        return None
+    try:
+        start = cache.get(FLUSHED_KEY, 0)
+        end = cache.get(SEQUENCE_KEY, 0)
+        flushed = 0
+        for first in range(start + 1, end + 1, batch_size):
+            slots = [f'{PENDING_KEY_PREFIX}{slot}' for slot in range(first, min(first + batch_size, end + 1))]
+            product_ids = set(cache.get_many(slots).values())
+            flushed += flush_view_counts(product_ids, batch_size)
+            cache.set(FLUSHED_KEY, first + len(slots) - 1, timeout=None)
+            cache.delete_many(slots)
+        return flushed
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def flush_all_views(product_ids, batch_size=None):
+    """
+    Flush the given products, such as the whole catalog, waiting for the
+    flush lock up to LOCK_TIMEOUT seconds
+    """
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise TimeoutError('Timed out waiting for the product view count flush lock')
+        time.sleep(1)
+    try:
+        return flush_view_counts(product_ids, batch_size)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+class ViewCountBuffer:
+    """
+    Records product views and starts a background flush of all the pending
+    products once VIEW_COUNT_FLUSH_INTERVAL seconds have passed or this
+    process recorded VIEW_COUNT_FLUSH_BATCH_SIZE views. When the cache is not
+    shared, views are written right away and the flush refreshes the
+    products viewed by this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recorded = 0
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._viewed = set()
+
+    def record(self, product_id):
+        shared = uses_shared_cache()
+        if shared:
+            record_view(product_id)
+        else:
+            write_view(product_id)
+
+        with self._lock:
+            self._recorded += 1
+            if not shared:
+                self._viewed.add(product_id)
+            due = (
+                self._recorded >= settings.VIEW_COUNT_FLUSH_BATCH_SIZE
+                or time.monotonic() - self._last_flush >= settings.VIEW_COUNT_FLUSH_INTERVAL
+            )
+            if not due or self._flushing:
+                return
+            self._flushing = True
+            self._recorded = 0
+            self._last_flush = time.monotonic()
+
+        threading.Thread(target=self._flush_in_background, daemon=True).start()
+
+    def flush(self):
+        """Flush the views pending in every process, or refresh the products viewed by this one"""
+        if uses_shared_cache():
+            return flush_pending_views()
+        with self._lock:
+            viewed, self._viewed = self._viewed, set()
+        return refresh_viewed(viewed)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Error flushing product view counts')
+        finally:
+            self._flushing = False
+            connections.close_all()
+
+
+view_counter = ViewCountBuffer()
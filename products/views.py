@@ -1,14 +1,35 @@
-from rest_framework import viewsets, permissions, status, filters
+from datetime import datetime, time, timedelta
+from rest_framework import viewsets, permissions, serializers, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema, extend_schema_view
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
+from core.cache import CachedResponseMixin, ConditionalGetMixin
+from core.pagination import KeysetCursorPagination
+from core.serializers import is_field_requested
+from recommendations.models import RelatedProduct
+from recommendations.similarity import similar_product_ids
 from .models import Category, Product, ProductImage
+from .bulk_update import bulk_update_products
+from .facets import product_facets
+from .importer import FORMATS, ProductImporter, decode, get_format
+from .price_history import RESOLUTIONS, price_series
+from .search import ProductSearchFilter
+from .signals import CATALOG_CACHE_NAMESPACE
+from .trending import trending_product_ids
+from .view_counter import view_counter
 from .serializers import (
     CategorySerializer, CategoryDetailSerializer,
-    ProductListSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer,
-    ProductImageSerializer
+    ProductListSerializer, ProductListRowSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer,
+    ProductImageSerializer, ProductBulkUpdateSerializer
 )
 
 
@@ -20,13 +41,25 @@ from .serializers import (
     partial_update=extend_schema(description="Partially update a category"),
     destroy=extend_schema(description="Delete a category")
 )
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     lookup_field = 'pk'
+    cache_namespace = CATALOG_CACHE_NAMESPACE
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # Only the first products of each category are embedded
+            size = settings.CATEGORY_PRODUCTS_PREVIEW_SIZE
+            products = Product.objects.with_main_image().order_by('-created_at', '-id')[:size + 1]
+            queryset = queryset.prefetch_related(
+                Prefetch('products', queryset=products, to_attr='preview_products')
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return CategoryDetailSerializer
@@ -50,23 +83,36 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema_view(
-    list=extend_schema(description="List all products"),
+    list=extend_schema(description="List all products", responses=ProductListSerializer),
     retrieve=extend_schema(description="Retrieve a product by ID"),
     create=extend_schema(description="Create a new product"),
     update=extend_schema(description="Update a product"),
     partial_update=extend_schema(description="Partially update a product"),
     destroy=extend_schema(description="Delete a product")
 )
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     lookup_field = 'pk'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    lookup_value_regex = r'\d+'
+    pagination_class = KeysetCursorPagination
+    cache_namespace = CATALOG_CACHE_NAMESPACE
+    # Anonymous read-only actions, all served from the response cache
+    public_actions = ('list', 'retrieve', 'facets', 'trending', 'related', 'similar', 'bulk', 'price_history')
+    cached_actions = public_actions
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'available', 'featured']
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'created_at', 'sales_count', 'view_count']
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.select_related('category')
+            if is_field_requested(self.request, 'images'):
+                queryset = queryset.prefetch_related('images')
+        elif self.action in ['list', 'export']:
+            queryset = self.get_list_queryset(queryset)
+
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         category_id = self.request.query_params.get('category_id')
@@ -80,16 +126,28 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def get_list_queryset(self, queryset):
+        """
+        Select the values ProductListRowSerializer renders, plus the keys read
+        by the cursor pagination
+        """
+        value_fields = self.get_serializer().get_value_fields()
+        return queryset.values(*dict.fromkeys([*value_fields, *self.ordering_fields, 'created_at']))
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
         elif self.action in ['create', 'update', 'partial_update']:
             return ProductCreateUpdateSerializer
+        elif self.action in ['list', 'export', 'trending', 'related', 'similar', 'bulk']:
+            return ProductListRowSerializer
         return ProductListSerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in self.public_actions:
             return [permissions.AllowAny()]
+        elif self.action in ['export', 'import_products', 'bulk_update']:
+            return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
     def get_authenticators(self):
@@ -98,23 +156,225 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Look up the corresponding action in the action_map
         if hasattr(self, 'action_map') and http_method in self.action_map:
             action = self.action_map[http_method]
-            if action in ['list', 'retrieve']:
+            if action in self.public_actions:
                 return []
 
         return super().get_authenticators()
 
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        instance.view_count += 1
-        instance.save()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        response = super().retrieve(request, *args, **kwargs)
+        # Count the view even when the response is cached or not modified
+        view_counter.record(int(kwargs['pk']))
+        return response
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Get category, availability, featured and price facet counts for the current filters"""
+        return self.get_cached_response(self._facets, request)
+
+    def _facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(product_facets(queryset))
+
+    @extend_schema(responses=ProductListSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """Get the available products with the highest time-decayed views and sales (?limit=)"""
+        return self.get_cached_response(self._trending, request)
+
+    def _trending(self, request):
+        try:
+            limit = int(request.query_params.get('limit', settings.TRENDING_SIZE))
+        except ValueError:
+            limit = settings.TRENDING_SIZE
+        limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+        return Response(self.get_product_rows(Product.objects.all(), trending_product_ids(limit)))
+
+    def get_product_rows(self, queryset, product_ids):
+        """Serialize the products of ``product_ids`` found in ``queryset``, in the order of the ids"""
+        serializer = self.get_serializer()
+        rows = {
+            row['id']: row
+            for row in queryset.filter(pk__in=product_ids).values(*serializer.get_value_fields())
+        }
+        products = [rows[product_id] for product_id in product_ids if product_id in rows]
+        return self.get_serializer(products, many=True).data
+
+    @extend_schema(
+        parameters=[OpenApiParameter('ids', str, description='Comma separated product ids')],
+        responses=ProductListSerializer(many=True)
+    )
+    @action(detail=False, methods=['get'])
+    def bulk(self, request):
+        """Get several products by id (?ids=1,2,3) in the requested order, without counting views"""
+        return self.get_cached_response(self._bulk, request)
+
+    def _bulk(self, request):
+        try:
+            product_ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'Product ids must be integers'})
+
+        product_ids = list(dict.fromkeys(product_ids))
+        if len(product_ids) > settings.PRODUCT_BULK_MAX_IDS:
+            raise ValidationError({'ids': f'At most {settings.PRODUCT_BULK_MAX_IDS} products can be requested at once'})
+        return Response(self.get_product_rows(Product.objects.all(), product_ids))
+
+    @extend_schema(parameters=[
+        OpenApiParameter('start', str, description='Start date or datetime, one year ago by default'),
+        OpenApiParameter('end', str, description='End date or datetime, now by default'),
+        OpenApiParameter('resolution', str, enum=RESOLUTIONS, description='Chosen from the range by default'),
+    ])
+    @action(detail=True, methods=['get'])
+    def price_history(self, request, pk=None):
+        """Get the price of a product over time as a chart-ready series"""
+        return self.get_cached_response(self._price_history, request, pk=pk)
+
+    def _price_history(self, request, pk=None):
+        self._check_product(pk)
+        end = self._parse_moment('end') or timezone.now()
+        start = self._parse_moment('start') or end - timedelta(days=365)
+        resolution = request.query_params.get('resolution') or None
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise ValidationError({'resolution': f"Must be one of {', '.join(RESOLUTIONS)}"})
+        if start >= end:
+            raise ValidationError({'start': 'Must be before the end'})
+
+        resolution, columns, rows = price_series(int(pk), start, end, resolution)
+        time_field = serializers.DateTimeField()
+        return Response({
+            'product': int(pk),
+            'resolution': resolution,
+            'start': time_field.to_representation(start),
+            'end': time_field.to_representation(end),
+            'columns': columns,
+            'data': [
+                [time_field.to_representation(row[0]), *(str(value) if value is not None else None for value in row[1:])]
+                for row in rows
+            ],
+        })
+
+    def _parse_moment(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({param: 'Must be an ISO 8601 date or datetime'})
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def _check_product(self, pk):
+        """404 for an unknown product, the detail actions below do not load it"""
+        if not Product.objects.filter(pk=pk).exists():
+            raise NotFound()
+
+    @extend_schema(responses=ProductListSerializer(many=True))
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Get the available products most often bought together with this one"""
+        return self.get_cached_response(self._related, request, pk=pk)
+
+    def _related(self, request, pk=None):
+        self._check_product(pk)
+        lookups = self.get_serializer().get_value_fields()
+        # A single query on the (product, rank) index, joined to the neighbors
+        neighbors = RelatedProduct.objects.filter(product_id=pk, related__available=True).order_by('rank')
+        products = [
+            dict(zip(lookups, values))
+            for values in neighbors.values_list(*[f'related__{lookup}' for lookup in lookups])
+        ]
+        return Response(self.get_serializer(products, many=True).data)
+
+    @extend_schema(responses=ProductListSerializer(many=True))
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get the available products whose name and description are closest to this one"""
+        return self.get_cached_response(self._similar, request, pk=pk)
+
+    def _similar(self, request, pk=None):
+        self._check_product(pk)
+        product_ids = similar_product_ids(int(pk), settings.SIMILAR_PRODUCTS_TOP_K)
+        return Response(self.get_product_rows(Product.objects.filter(available=True), product_ids))
+
+    @extend_schema(responses=ProductListSerializer(many=True))
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every product matching the filters as a JSON array (staff only)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        response = StreamingHttpResponse(
+            serializer.iter_json(queryset.iterator(chunk_size=2000)),
+            content_type='application/json'
+        )
+        response['Content-Disposition'] = 'attachment; filename="products.json"'
+        return response
+
+    @extend_schema(
+        request={'multipart/form-data': {
+            'type': 'object',
+            'properties': {'file': {'type': 'string', 'format': 'binary'}, 'format': {'enum': list(FORMATS)}}
+        }},
+        responses=OpenApiTypes.OBJECT
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_products(self, request):
+        """
+        Create or update products by slug from a CSV or JSON Lines file
+        (staff only), returns the counts and the invalid rows
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'No file was submitted.'})
+        file_format = request.data.get('format') or get_format(upload.name)
+        if file_format not in FORMATS:
+            raise ValidationError({'format': f"Must be one of {', '.join(FORMATS)}"})
+
+        importer = ProductImporter().import_file(decode(upload), file_format)
+        return Response(importer.get_report())
+
+    @extend_schema(request={'application/json': {
+        'type': 'object',
+        'additionalProperties': ProductBulkUpdateSerializer
+    }}, responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """
+        Update the price, discount, stock or availability of many products
+        (staff only), keyed by id or slug, with per-product results
+        """
+        if not isinstance(request.data, dict) or not request.data:
+            raise ValidationError({'detail': 'Expected an object of changes keyed by product id or slug.'})
+        if len(request.data) > settings.PRODUCT_BULK_UPDATE_MAX_ITEMS:
+            raise ValidationError({'detail': f'At most {settings.PRODUCT_BULK_UPDATE_MAX_ITEMS} products per request.'})
+
+        results, updates = {}, {}
+        for key, changes in request.data.items():
+            serializer = ProductBulkUpdateSerializer(data=changes)
+            if serializer.is_valid():
+                updates[key] = serializer.validated_data
+            else:
+                results[key] = {'status': 'invalid', 'errors': serializer.errors}
+        results.update(bulk_update_products(updates))
+
+        # Decimals rendered like the other product endpoints
+        field = serializers.DecimalField(max_digits=10, decimal_places=2)
+        for result in results.values():
+            for name in ('price', 'price_discount'):
+                if result.get(name) is not None:
+                    result[name] = field.to_representation(result[name])
+        return Response({'results': {key: results[key] for key in request.data}})
 
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser])
-    def upload_image(self, request, slug=None):
+    def upload_image(self, request, pk=None):
         """Upload an image to a product"""
         product = self.get_object()
-        serializer = ProductImageSerializer(data=request.data)
+        serializer = ProductImageSerializer(data=request.data, context=self.get_serializer_context())
 
         if serializer.is_valid():
             serializer.save(product=product)
@@ -122,11 +382,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['get'])
-    def images(self, request, slug=None):
+    def images(self, request, pk=None):
         """Get all images for a product"""
         product = self.get_object()
         images = ProductImage.objects.filter(product=product)
-        serializer = ProductImageSerializer(images, many=True)
+        serializer = ProductImageSerializer(images, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
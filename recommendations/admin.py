@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import CoPurchaseBuild, RelatedProduct
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'related', 'count')
+    search_fields = ('product__name', 'related__name')
+    raw_id_fields = ('product', 'related')
+
+
+@admin.register(CoPurchaseBuild)
+class CoPurchaseBuildAdmin(admin.ModelAdmin):
+    list_display = ('last_order_id', 'orders', 'pairs', 'created_at')
+    readonly_fields = ('last_order_id', 'orders', 'pairs', 'created_at', 'updated_at')
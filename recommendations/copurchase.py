@@ -0,0 +1,190 @@
+"""
+"Frequently bought together" recommendations from the order history.
+
+Orders are read in batches of (order, product) rows and turned into
+co-occurrence pairs with NumPy, without a Python loop per order. The pair
+counts are added to the sparse CoPurchaseCount matrix, then the top-K
+neighbors of every product whose row changed are recomputed into
+RelatedProduct. Each run starts after the last order of the previous one,
+recorded in the CoPurchaseBuild row, which runs lock so they never overlap.
+"""
+
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from core.db import bulk_upsert
+from orders.models import Order, OrderItem
+from products.signals import invalidate_catalog_cache
+from .models import CoPurchaseBuild, CoPurchaseCount, RelatedProduct
+
+# Orders younger than this may still be committing with a lower id than
+# newer ones, they are left for the next run
+SETTLE_TIME = timedelta(minutes=1)
+
+# The single CoPurchaseBuild row
+BUILD_ID = 1
+
+
+def order_pairs(order_ids, product_ids):
+    """
+    Return the ``(product, related)`` arrays of every ordered pair of distinct
+    products bought in the same order, one pair per order
+    """
+    # One row per product and order, sorted by order
+    rows = np.unique(np.stack([order_ids, product_ids], axis=1), axis=0)
+    orders, products = rows[:, 0], rows[:, 1]
+    if not len(orders):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+
+    # Pair every row with each row of its order: row i is repeated as many
+    # times as its order has rows, and walks through them with an offset
+    row_sizes = np.repeat(sizes, sizes)
+    row_starts = np.repeat(starts, sizes)
+    left = np.repeat(np.arange(len(orders)), row_sizes)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes)
+    right = np.repeat(row_starts, row_sizes) + offsets
+
+    distinct = left != right
+    return products[left[distinct]], products[right[distinct]]
+
+
+def count_pairs(product, related, count=None):
+    """
+    Return the unique ``(product, related)`` pairs, sorted, with the number of
+    times each occurs, or the sum of their ``count``
+    """
+    if not len(product):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    pairs, inverse = np.unique(np.stack([product, related], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if count is None:
+        totals = np.bincount(inverse)
+    else:
+        totals = np.bincount(inverse, weights=count).astype(np.int64)
+    return pairs[:, 0], pairs[:, 1], totals
+
+
+def top_k(product, related, count, k):
+    """Keep the ``k`` highest counts of every product, ranked from 0"""
+    order = np.lexsort((related, -count, product))
+    product, related, count = product[order], related[order], count[order]
+    starts = np.flatnonzero(np.r_[True, product[1:] != product[:-1]])
+    sizes = np.diff(np.r_[starts, len(product)])
+    rank = np.arange(len(product)) - np.repeat(starts, sizes)
+    keep = rank < k
+    return product[keep], related[keep], count[keep], rank[keep]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def add_orders(after_order_id, until, batch_size):
+    """
+    Count the product pairs of the orders after ``after_order_id`` created up
+    to ``until``. Returns ``(last_order_id, orders, product, related, count)``.
+    """
+    last_order_id, order_count = after_order_id, 0
+    batches = []
+
+    while True:
+        order_ids = list(
+            Order.objects.filter(pk__gt=last_order_id, created_at__lte=until)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            break
+
+        items = np.array(
+            OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        product, related = order_pairs(items[:, 0], items[:, 1])
+        # Reduce each batch right away so memory follows the number of pairs
+        batches.append(count_pairs(product, related))
+
+        last_order_id = order_ids[-1]
+        order_count += len(order_ids)
+
+    if not batches:
+        return (last_order_id, order_count, *count_pairs([], []))
+    product, related, count = (np.concatenate(column) for column in zip(*batches))
+    return (last_order_id, order_count, *count_pairs(product, related, count))
+
+
+def merge_counts(product, related, count, batch_size):
+    """Add the new pair counts, sorted by product, to CoPurchaseCount"""
+    # Chunks of batch_size products, each with all its pairs
+    for starts in _chunks(np.flatnonzero(np.r_[True, product[1:] != product[:-1]]), batch_size):
+        start = starts[0]
+        end = np.searchsorted(product, product[starts[-1]], side='right')
+
+        chunk = product[start:end], related[start:end], count[start:end]
+        existing = {
+            (p, r): c for p, r, c in CoPurchaseCount.objects.filter(
+                product_id__in=np.unique(chunk[0]).tolist()
+            ).values_list('product_id', 'related_id', 'count')
+        }
+        bulk_upsert(
+            CoPurchaseCount,
+            [
+                CoPurchaseCount(product_id=p, related_id=r, count=existing.get((p, r), 0) + c)
+                for p, r, c in zip(*(column.tolist() for column in chunk))
+            ],
+            unique_fields=['product', 'related'],
+            update_fields=['count'],
+            batch_size=1000
+        )
+
+
+def rebuild_related(product_ids, k, batch_size):
+    """Recompute the top ``k`` neighbors of the given products"""
+    for chunk in _chunks(sorted(product_ids), batch_size):
+        cells = np.array(
+            CoPurchaseCount.objects.filter(product_id__in=chunk).values_list('product_id', 'related_id', 'count'),
+            dtype=np.int64
+        ).reshape(-1, 3)
+        product, related, count, rank = top_k(cells[:, 0], cells[:, 1], cells[:, 2], k)
+
+        RelatedProduct.objects.filter(product_id__in=chunk).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=p, related_id=r, count=c, rank=n)
+            for p, r, c, n in zip(product.tolist(), related.tolist(), count.tolist(), rank.tolist())
+        ], batch_size=1000)
+
+
+def build_recommendations(rebuild=False, batch_size=1000):
+    """
+    Add the orders placed since the last build to the recommendations, or
+    recount every order with ``rebuild``. Returns the CoPurchaseBuild.
+    """
+    # Created in its own transaction, so a concurrent first run finds it
+    CoPurchaseBuild.objects.get_or_create(pk=BUILD_ID, defaults={'last_order_id': 0})
+
+    # A single transaction, so a failed run never counts orders twice
+    with transaction.atomic():
+        # A concurrent run waits here until this one commits
+        build = CoPurchaseBuild.objects.select_for_update().get(pk=BUILD_ID)
+        if rebuild:
+            RelatedProduct.objects.all().delete()
+            CoPurchaseCount.objects.all().delete()
+            build.last_order_id = 0
+
+        last_order_id, order_count, product, related, count = add_orders(
+            build.last_order_id, timezone.now() - SETTLE_TIME, batch_size
+        )
+        if len(product):
+            merge_counts(product, related, count, batch_size)
+            rebuild_related(np.unique(product).tolist(), settings.RECOMMENDATIONS_TOP_K, batch_size)
+            invalidate_catalog_cache()
+
+        build.last_order_id, build.orders, build.pairs = last_order_id, order_count, len(product)
+        build.save()
+        return build
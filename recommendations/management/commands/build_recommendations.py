@@ -0,0 +1,24 @@
+import logging
+from django.core.management.base import BaseCommand
+from recommendations.copurchase import build_recommendations
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Add the orders placed since the last run to the "frequently bought together" recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rebuild', action='store_true', help='Recount the whole order history')
+
+    def handle(self, *args, **options):
+        try:
+            build = build_recommendations(rebuild=options['rebuild'], batch_size=options['batch_size'])
+        except Exception as error:
+            logger.exception('Erro inesperado em build_recommendations: %s', error)
+            raise
+
+        self.stdout.write(
+            f"Processed {build.orders} orders up to order {build.last_order_id}, {build.pairs} product pairs updated."
+        )
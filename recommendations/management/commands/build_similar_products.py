@@ -0,0 +1,30 @@
+import logging
+from django.core.management.base import BaseCommand
+from recommendations.similarity import build_similar_products
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Update the content-based similar products index with the products changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--chunk-size', type=int, default=256,
+                            help='Products compared with the whole catalog at once')
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from scratch')
+
+    def handle(self, *args, **options):
+        try:
+            result = build_similar_products(
+                rebuild=options['rebuild'], batch_size=options['batch_size'], chunk_size=options['chunk_size']
+            )
+        except Exception as error:
+            logger.exception('Erro inesperado em build_similar_products: %s', error)
+            raise
+
+        kind = 'Rebuilt' if result['full_build'] else 'Updated'
+        self.stdout.write(
+            f"{kind} the similar products index: {result['products']} products, "
+            f"{result['changed']} reindexed, {result['removed']} removed."
+        )
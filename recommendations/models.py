@@ -0,0 +1,53 @@
+from django.db import models
+from core.models import TimeStampedModel
+from products.models import Product
+
+
+class CoPurchaseCount(models.Model):
+    """
+    Number of orders containing both products, the sparse product x product
+    co-occurrence matrix stored one row per non-zero cell (both directions)
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'related')
+
+    def __str__(self):
+        return f"{self.product_id} and {self.related_id} bought together {self.count} times"
+
+
+class RelatedProduct(models.Model):
+    """
+    The RECOMMENDATIONS_TOP_K products most often bought with a product
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        # Serves the neighbors of a product, in order, from the index
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"#{self.rank} for {self.product_id}: {self.related_id}"
+
+
+class CoPurchaseBuild(TimeStampedModel):
+    """
+    The last run of build_recommendations, a single row locked by the runs,
+    the next run starts after last_order_id
+    """
+    last_order_id = models.PositiveBigIntegerField()
+    orders = models.PositiveIntegerField(default=0)
+    pairs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Recommendations built up to order {self.last_order_id}"
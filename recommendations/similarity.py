@@ -0,0 +1,330 @@
+"""
+Content-based "similar products" from the product names and descriptions.
+
+Texts are turned into hashed TF-IDF vectors (feature hashing, so there is no
+vocabulary to keep) and the top-K cosine neighbors of every product are
+precomputed with NumPy, fully offline. The index is a directory of .npy files
+that the web workers open with ``mmap_mode='r'``, so the arrays are shared
+through the OS page cache instead of being copied into every worker.
+
+A build writes a new version directory and then switches the CURRENT pointer
+file, so readers never see a half-written index. Incremental builds only
+vectorize the products whose text changed since the last build: the rows that
+pointed to changed or deleted products are recomputed and the changed
+products are merged into the other rows. The IDF weights are kept from the
+last full build, which is redone once the changes add up to
+FULL_REBUILD_RATIO of the index.
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.models import Product
+
+POINTER_FILE = 'CURRENT'
+NAME_WEIGHT = 2  # name words count as this many description words
+FULL_REBUILD_RATIO = 0.2
+KEEP_VERSIONS = 2
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def text_hash(name, description):
+    """Return a checksum of the indexed text, to detect changes"""
+    return zlib.crc32(f'{name}\0{description}'.encode('utf-8'))
+
+
+class HashedTfidfVectorizer:
+    """
+    Signed feature hashing of the words of a product, weighted with sublinear
+    term frequencies and the IDF of the hash buckets
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self._buckets = {}
+
+    def _bucket(self, token):
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            value = zlib.crc32(token.encode('utf-8'))
+            bucket = self._buckets[token] = (value % self.dimensions, 1.0 if value & 0x80000000 else -1.0)
+        return bucket
+
+    def terms(self, name, description):
+        """Return the buckets and signed term weights of a product text"""
+        counts = Counter(TOKEN_RE.findall((name or '').lower()) * NAME_WEIGHT)
+        counts.update(TOKEN_RE.findall((description or '').lower()))
+
+        buckets = np.empty(len(counts), dtype=np.int64)
+        weights = np.empty(len(counts), dtype=np.float32)
+        for i, (token, count) in enumerate(counts.items()):
+            buckets[i], sign = self._bucket(token)
+            weights[i] = sign * (1 + math.log(count))
+        return buckets, weights
+
+    def idf(self, documents):
+        """Return the smoothed inverse document frequency of every bucket"""
+        rows, buckets, _ = self._entries(documents)
+        present = np.unique(rows * self.dimensions + buckets) % self.dimensions
+        df = np.bincount(present, minlength=self.dimensions)
+        return (np.log((1 + len(documents)) / (1 + df)) + 1).astype(np.float32)
+
+    def transform(self, documents, idf):
+        """Return the L2 normalized TF-IDF vectors of the documents"""
+        rows, buckets, weights = self._entries(documents)
+        vectors = np.zeros((len(documents), self.dimensions), dtype=np.float32)
+        np.add.at(vectors, (rows, buckets), weights * idf[buckets])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _entries(documents):
+        sizes = [len(buckets) for buckets, _ in documents]
+        if not sum(sizes):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.repeat(np.arange(len(documents)), sizes)
+        buckets = np.concatenate([buckets for buckets, _ in documents])
+        weights = np.concatenate([weights for _, weights in documents])
+        return rows, buckets, weights
+
+
+def select_top(similarities, candidates, k):
+    """
+    Return the ``(ids, scores)`` of the ``k`` most similar candidates of each
+    row, best first. ``candidates`` holds the ids of the columns, shared by all
+    rows or one line per row. Missing neighbors are -1 with a score of 0.
+    """
+    neighbors = np.full((len(similarities), k), -1, dtype=np.int64)
+    scores = np.zeros((len(similarities), k), dtype=np.float32)
+    size = min(k, similarities.shape[1])
+    if not size:
+        return neighbors, scores
+
+    top = np.argpartition(-similarities, size - 1, axis=1)[:, :size]
+    top_scores = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    top_ids = candidates[top] if candidates.ndim == 1 else np.take_along_axis(candidates, top, axis=1)
+
+    # Products without a word in common are not similar
+    similar = top_scores > 0
+    neighbors[:, :size] = np.where(similar, top_ids, -1)
+    scores[:, :size] = np.where(similar, top_scores, 0)
+    return neighbors, scores
+
+
+def nearest_neighbors(rows, vectors, ids, k, chunk_size):
+    """Return the top ``k`` neighbors among all ``ids`` of the products at the positions ``rows``"""
+    neighbors = np.full((len(rows), k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        similarities = vectors[chunk] @ vectors.T
+        similarities[np.arange(len(chunk)), chunk] = 0  # not similar to itself
+        neighbors[start:start + chunk_size], scores[start:start + chunk_size] = select_top(similarities, ids, k)
+    return neighbors, scores
+
+
+class SimilarProductsIndex:
+    """A version of the index, with its arrays memory-mapped read-only"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta:
+            self.meta = json.load(meta)
+        for name in ('ids', 'hashes', 'idf', 'vectors', 'neighbors', 'scores'):
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+    def similar(self, product_id, limit):
+        """Return the ids of the products most similar to ``product_id``, best first"""
+        row = np.searchsorted(self.ids, product_id)
+        if row >= len(self.ids) or self.ids[row] != product_id:
+            return []
+        return [int(neighbor) for neighbor in self.neighbors[row][:limit] if neighbor != -1]
+
+
+_loaded_index = None
+
+
+def get_index():
+    """Return the current index, reloaded when a build switched versions"""
+    global _loaded_index
+    directory = settings.SIMILAR_PRODUCTS_INDEX_DIR
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as pointer:
+            version = pointer.read().strip()
+    except FileNotFoundError:
+        return None
+
+    path = os.path.join(directory, version)
+    if _loaded_index is None or _loaded_index.path != path:
+        _loaded_index = SimilarProductsIndex(path)
+    return _loaded_index
+
+
+def similar_product_ids(product_id, limit):
+    index = get_index()
+    return index.similar(product_id, limit) if index is not None else []
+
+
+class IndexWriter:
+    """Writes a new version of the index and makes it current"""
+
+    def __init__(self, directory, size, dimensions):
+        self.directory = directory
+        self.version = str(time.time_ns())
+        self.path = os.path.join(directory, self.version)
+        os.makedirs(self.path)
+        self.vectors = np.lib.format.open_memmap(
+            os.path.join(self.path, 'vectors.npy'), mode='w+', dtype=np.float32, shape=(size, dimensions)
+        )
+
+    def save(self, meta, **arrays):
+        self.vectors.flush()
+        for name, array in arrays.items():
+            np.save(os.path.join(self.path, f'{name}.npy'), array)
+        with open(os.path.join(self.path, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        publish_version(self.directory, self.version)
+
+
+def publish_version(directory, version):
+    pointer = os.path.join(directory, POINTER_FILE)
+    with open(f'{pointer}.tmp', 'w') as file:
+        file.write(version)
+    os.replace(f'{pointer}.tmp', pointer)
+
+    # Workers still reading an old version keep their open memory maps
+    versions = sorted(name for name in os.listdir(directory) if name.isdigit())
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def _products(queryset, batch_size):
+    return queryset.order_by('pk').values_list('pk', 'name', 'description').iterator(chunk_size=batch_size)
+
+
+def build_similar_products(rebuild=False, batch_size=1000, chunk_size=256):
+    """
+    Bring the index up to date with the products, rebuilding it from scratch
+    with ``rebuild``. Returns a dict describing what was done.
+    """
+    directory = settings.SIMILAR_PRODUCTS_INDEX_DIR
+    os.makedirs(directory, exist_ok=True)
+    dimensions = settings.SIMILAR_PRODUCTS_DIMENSIONS
+    k = settings.SIMILAR_PRODUCTS_TOP_K
+    started = timezone.now()
+
+    index = get_index()
+    if (
+        rebuild or index is None
+        or index.meta['dimensions'] != dimensions or index.meta['top_k'] != k
+    ):
+        return _full_build(directory, dimensions, k, started, batch_size, chunk_size)
+    return _incremental_build(index, directory, dimensions, k, started, batch_size, chunk_size)
+
+
+def _full_build(directory, dimensions, k, started, batch_size, chunk_size):
+    vectorizer = HashedTfidfVectorizer(dimensions)
+    ids, hashes, documents = [], [], []
+    for pk, name, description in _products(Product.objects.all(), batch_size):
+        ids.append(pk)
+        hashes.append(text_hash(name, description))
+        documents.append(vectorizer.terms(name, description))
+    ids = np.array(ids, dtype=np.int64)
+
+    idf = vectorizer.idf(documents)
+    writer = IndexWriter(directory, len(ids), dimensions)
+    for start in range(0, len(ids), batch_size):
+        writer.vectors[start:start + batch_size] = vectorizer.transform(documents[start:start + batch_size], idf)
+
+    neighbors, scores = nearest_neighbors(np.arange(len(ids)), writer.vectors, ids, k, chunk_size)
+    meta = {
+        'built_at': started.isoformat(),
+        'dimensions': dimensions,
+        'top_k': k,
+        'products': len(ids),
+        'changes_since_full_build': 0,
+    }
+    writer.save(meta, ids=ids, hashes=np.array(hashes, dtype=np.uint32), idf=idf, neighbors=neighbors, scores=scores)
+    return {'full_build': True, 'products': len(ids), 'changed': len(ids), 'removed': 0}
+
+
+def _incremental_build(index, directory, dimensions, k, started, batch_size, chunk_size):
+    vectorizer = HashedTfidfVectorizer(dimensions)
+    product_ids = np.array(Product.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+    removed = np.setdiff1d(index.ids, product_ids)
+
+    # Products saved since the last build, kept when their text changed
+    changed, changed_hashes, documents = [], [], []
+    recent = Product.objects.filter(updated_at__gte=parse_datetime(index.meta['built_at']))
+    for pk, name, description in _products(recent, batch_size):
+        row = np.searchsorted(index.ids, pk)
+        checksum = text_hash(name, description)
+        if row < len(index.ids) and index.ids[row] == pk and index.hashes[row] == checksum:
+            continue
+        changed.append(pk)
+        changed_hashes.append(checksum)
+        documents.append(vectorizer.terms(name, description))
+    changed = np.array(changed, dtype=np.int64)
+
+    result = {'full_build': False, 'products': len(product_ids), 'changed': len(changed), 'removed': len(removed)}
+    changes = index.meta['changes_since_full_build'] + len(changed) + len(removed)
+    if changes > FULL_REBUILD_RATIO * max(len(index.ids), 1):
+        return _full_build(directory, dimensions, k, started, batch_size, chunk_size)
+
+    meta = dict(index.meta, built_at=started.isoformat(), products=len(product_ids), changes_since_full_build=changes)
+    if not len(changed) and not len(removed):
+        # Nothing to reindex, only move the start of the next incremental build
+        with open(os.path.join(index.path, 'meta.json.tmp'), 'w') as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(index.path, 'meta.json.tmp'), os.path.join(index.path, 'meta.json'))
+        return result
+
+    kept = ~np.isin(index.ids, np.concatenate([removed, changed]))
+    ids = np.union1d(index.ids[kept], changed)
+    kept_rows = np.searchsorted(ids, index.ids[kept])
+    changed_rows = np.searchsorted(ids, changed)
+
+    writer = IndexWriter(directory, len(ids), dimensions)
+    old_rows = np.flatnonzero(kept)
+    for start in range(0, len(old_rows), batch_size):
+        writer.vectors[kept_rows[start:start + batch_size]] = index.vectors[old_rows[start:start + batch_size]]
+    writer.vectors[changed_rows] = vectorizer.transform(documents, np.asarray(index.idf))
+
+    hashes = np.empty(len(ids), dtype=np.uint32)
+    hashes[kept_rows] = index.hashes[kept]
+    hashes[changed_rows] = changed_hashes
+    neighbors = np.empty((len(ids), k), dtype=np.int64)
+    scores = np.empty((len(ids), k), dtype=np.float32)
+    neighbors[kept_rows] = index.neighbors[kept]
+    scores[kept_rows] = index.scores[kept]
+
+    # Rows that pointed to a changed or deleted product are recomputed, with
+    # the changed products themselves
+    stale = kept_rows[np.isin(neighbors[kept_rows], np.concatenate([removed, changed])).any(axis=1)]
+    recompute = np.union1d(stale, changed_rows)
+    neighbors[recompute], scores[recompute] = nearest_neighbors(recompute, writer.vectors, ids, k, chunk_size)
+
+    # The other rows only need the changed products merged into their lists
+    others = np.setdiff1d(kept_rows, stale)
+    changed_vectors = writer.vectors[changed_rows]
+    for start in range(0, len(others), chunk_size):
+        rows = others[start:start + chunk_size]
+        candidates = np.hstack([neighbors[rows], np.broadcast_to(changed, (len(rows), len(changed)))])
+        similarities = np.hstack([scores[rows], writer.vectors[rows] @ changed_vectors.T])
+        neighbors[rows], scores[rows] = select_top(similarities, candidates, k)
+
+    writer.save(meta, ids=ids, hashes=hashes, idf=np.asarray(index.idf), neighbors=neighbors, scores=scores)
+    return result